@@ -0,0 +1,437 @@
+"""Batch jobs that drive the CashIt core from files instead of the console.
+
+    python batch.py payments <settlement.csv|.jsonl> [results.csv]
+    python batch.py payroll <payroll.csv|.jsonl> [results.csv]
+    python batch.py onboard <accounts.csv|.jsonl> [rejects.csv]
+    python batch.py rebuild-spending
+    python batch.py archive [months]
+    python batch.py statement <cnic> <from YYYY-MM-DD> <to YYYY-MM-DD> [statement.csv|.txt]
+    python batch.py standing-orders [--every SECONDS]
+    python batch.py backup [backup.jsonl]
+    python batch.py verify-backup <backup.jsonl>
+
+A settlement file lists one payment per row with the columns
+cnic, kind (bill/tax/challan), reference and amount (in rupees).
+
+payroll credits every row of a file with the columns account (CNIC or
+IBAN), amount (in rupees) and description ("Salary Credit" if empty), all
+or nothing: if any row is invalid, no account is credited.
+
+onboard opens an account, with the opening bonus, for every row of a file
+with the columns cnic, name, iban and pin. Rows that are invalid or repeat
+a CNIC or IBAN (of the store or an earlier row) are listed in the rejects
+file; all the others are saved in one write.
+
+rebuild-spending recomputes every account's monthly spending totals from
+its full transaction history (needed once for data from older versions).
+
+archive moves transactions older than the last `months` calendar months
+(CASHIT_ARCHIVE_MONTHS, 12 by default; at least 1, the current month)
+into compressed per-month archive files. Statements and reports still
+read them.
+
+statement writes an account's transactions between two dates, as CSV or
+(for a .txt path) as a paged text statement ready to print. Rows are
+streamed from storage one at a time.
+
+standing-orders runs every standing order that is due, including runs
+missed while nothing was running, and commits them in one write. With
+--every it stays up and checks again every SECONDS seconds.
+
+backup writes a point-in-time copy of every account and its full history
+(by default to CASHIT_BACKUP_DIR, backups/, named by the time), without
+holding up anyone committing meanwhile, plus a .sha256 checksum file.
+verify-backup checks a backup against its checksum.
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from datetime import date
+
+import cashit
+import storage
+
+PAYMENT_COLUMNS = ("cnic", "kind", "reference", "amount")
+PAYROLL_COLUMNS = ("account", "amount", "description")
+PAYROLL_DESCRIPTION = "Salary Credit"
+ONBOARD_COLUMNS = ("cnic", "name", "iban", "pin")
+STATEMENT_COLUMNS = ("timestamp", "description", "type", "debit", "credit", "balance_after")
+STATEMENT_PAGE_ROWS = 50
+ARCHIVE_MONTHS = os.environ.get("CASHIT_ARCHIVE_MONTHS", "12")
+BACKUP_DIR = os.environ.get("CASHIT_BACKUP_DIR", "backups")
+
+# ---------------- FILE HELPERS ----------------
+
+def read_rows(path):
+    """Yield a dict per row of a CSV file (with a header line) or a JSONL file"""
+    with open(path, "r", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+def write_results(path, columns, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+def default_result_path(path):
+    return os.path.splitext(path)[0] + ".results.csv"
+
+def default_rejects_path(path):
+    return os.path.splitext(path)[0] + ".rejects.csv"
+
+def print_summary(title, total, accepted, rejects, elapsed):
+    print("\n" + "="*50)
+    print(f"          {title}          ")
+    print("="*50)
+    print(f"   Rows processed : {total:,}")
+    print(f"   Accepted       : {accepted:,}")
+    print(f"   Rejected       : {total - accepted:,}")
+    for reason, count in sorted(rejects.items()):
+        print(f"      {reason:<22}: {count:,}")
+    print(f"   Time taken     : {elapsed:.3f} s")
+    if elapsed > 0:
+        print(f"   Throughput     : {total / elapsed:,.0f} rows/sec")
+    print("="*50 + "\n")
+
+# ---------------- PAYMENTS ----------------
+
+def run_payments(store, path, result_path=None):
+    """Apply a settlement file through cashit.pay_batch() and write a per-row result file.
+    Returns (total rows, accepted rows, {reject reason: count}, seconds)."""
+    started = time.perf_counter()
+    rows = []          # (cnic, kind, reference, amount text, payment or None if unparseable)
+
+    for row in read_rows(path):
+        cnic, kind, reference, amount_text = (str(row.get(column) or "").strip() for column in PAYMENT_COLUMNS)
+        try:
+            payment = (cnic, kind.lower(), reference, cashit.parse_amount(amount_text))
+        except ValueError:
+            payment = None
+        rows.append((cnic, kind, reference, amount_text, payment))
+
+    outcomes = iter(cashit.pay_batch(store, [payment for *_, payment in rows if payment]))
+
+    results = []
+    rejects = {}
+    for number, (cnic, kind, reference, amount_text, payment) in enumerate(rows, start=1):
+        status, transaction = next(outcomes) if payment else ("invalid_row", None)
+        if status != "ok":
+            rejects[status] = rejects.get(status, 0) + 1
+        balance_after = cashit.rupees(transaction.balance_after) if transaction else ""
+        results.append((number, cnic, kind, reference, amount_text, status, balance_after))
+
+    write_results(result_path or default_result_path(path), ("row",) + PAYMENT_COLUMNS + ("status", "balance_after"), results)
+    elapsed = time.perf_counter() - started
+    return len(rows), len(rows) - sum(rejects.values()), rejects, elapsed
+
+# ---------------- PAYROLL ----------------
+
+def run_payroll(store, path, result_path=None):
+    """Apply a payroll file through cashit.payroll_credit() and write a per-row result file.
+    Returns (total rows, credited rows, {reject reason: count}, seconds)."""
+    started = time.perf_counter()
+    rows = []          # (account, amount text, description, amount or None if unparseable)
+
+    for row in read_rows(path):
+        account, amount_text, description = (str(row.get(column) or "").strip() for column in PAYROLL_COLUMNS)
+        try:
+            amount = cashit.parse_amount(amount_text)
+        except ValueError:
+            amount = None
+        rows.append((account, amount_text, description or PAYROLL_DESCRIPTION, amount))
+
+    outcomes = cashit.payroll_credit(store, [(account, amount, description) for account, _, description, amount in rows])
+
+    results = []
+    rejects = {}
+    for number, ((account, amount_text, description, _), (status, transaction)) in enumerate(zip(rows, outcomes), start=1):
+        if status != "ok":
+            rejects[status] = rejects.get(status, 0) + 1
+        balance_after = cashit.rupees(transaction.balance_after) if transaction else ""
+        results.append((number, account, amount_text, description, status, balance_after))
+
+    write_results(result_path or default_result_path(path), ("row",) + PAYROLL_COLUMNS + ("status", "balance_after"), results)
+    elapsed = time.perf_counter() - started
+    return len(rows), len(rows) - sum(rejects.values()), rejects, elapsed
+
+# ---------------- ONBOARDING ----------------
+
+def run_onboarding(store, path, rejects_path=None):
+    """Open the accounts of an onboarding file through cashit.onboard_accounts()
+    and write the rejected rows (without their PINs) to a rejects file.
+    Returns (total rows, opened accounts, {reject reason: count}, seconds)."""
+    started = time.perf_counter()
+    rows = []
+
+    def read():
+        for row in read_rows(path):
+            values = tuple(str(row.get(column) or "").strip() for column in ONBOARD_COLUMNS)
+            rows.append(values)
+            yield values
+
+    statuses = cashit.onboard_accounts(store, read())
+
+    rejected = []
+    rejects = {}
+    for number, ((cnic, name, iban, _), status) in enumerate(zip(rows, statuses), start=1):
+        if status != "ok":
+            rejects[status] = rejects.get(status, 0) + 1
+            rejected.append((number, cnic, name, iban, status))
+
+    write_results(rejects_path or default_rejects_path(path), ("row", "cnic", "name", "iban", "status"), rejected)
+    elapsed = time.perf_counter() - started
+    return len(rows), len(rows) - len(rejected), rejects, elapsed
+
+# ---------------- SPENDING TOTALS ----------------
+
+def rebuild_spending(store):
+    """Recompute the spending totals of every account from its history.
+    Returns (accounts rebuilt, seconds)."""
+    started = time.perf_counter()
+    cnics = [cnic for cnic, _ in store.items()]
+    for cnic in cnics:
+        cashit.rebuild_spending(store, cnic)
+    store.save_all()
+    return len(cnics), time.perf_counter() - started
+
+# ---------------- ARCHIVE ----------------
+
+def archive_cutoff(months, today=None):
+    """The first month ("YYYY-MM") of the last `months` calendar months, this one included"""
+    today = today or date.today()
+    index = today.year * 12 + today.month - 1 - (months - 1)
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+def archive_history(store, months):
+    """Archive what is older than the last `months` months.
+    Returns (transactions moved, cutoff month, seconds)."""
+    started = time.perf_counter()
+    cutoff = archive_cutoff(months)
+    moved = store.archive_history(cutoff)
+    return moved, cutoff, time.perf_counter() - started
+
+# ---------------- STATEMENTS ----------------
+
+def statement_row(t):
+    """(timestamp, description, type, debit, credit, balance_after) as text"""
+    amount = cashit.rupees(t.amount)
+    balance_after = cashit.rupees(t.balance_after) if t.balance_after is not None else ""
+    return (t.timestamp, t.description, t.type, amount if t.sign < 0 else "", amount if t.sign > 0 else "", balance_after)
+
+def write_statement_csv(path, acc, start, end, transactions):
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(STATEMENT_COLUMNS)
+        for t in transactions:
+            writer.writerow(statement_row(t))
+            count += 1
+    return count
+
+def statement_page_header(acc, start, end, page):
+    return [
+        f"{'CashIt — Account Statement':<70}{'Page ' + str(page):>14}",
+        f"Name: {acc['name']}    CNIC: {acc['cnic']}    IBAN: {acc.get('iban') or '-'}",
+        f"Period: {start} to {end}",
+        "-" * 84,
+        f"{'Date / time':<18}{'Description':<30}{'Debit':>12}{'Credit':>12}{'Balance':>12}",
+        "-" * 84,
+    ]
+
+def write_statement_text(path, acc, start, end, transactions):
+    """A printable statement: pages of STATEMENT_PAGE_ROWS rows split by form feeds,
+    then the totals"""
+    count = debited = credited = 0
+    with open(path, "w") as f:
+        f.write("\n".join(statement_page_header(acc, start, end, 1)) + "\n")
+        for t in transactions:
+            if count and count % STATEMENT_PAGE_ROWS == 0:
+                f.write("\f" + "\n".join(statement_page_header(acc, start, end, count // STATEMENT_PAGE_ROWS + 1)) + "\n")
+            timestamp, description, _, debit, credit, balance_after = statement_row(t)
+            f.write(f"{timestamp:<18}{description[:29]:<30}{debit:>12}{credit:>12}{balance_after:>12}\n")
+            count += 1
+            if t.sign < 0:
+                debited += t.amount
+            else:
+                credited += t.amount
+        f.write("-" * 84 + "\n")
+        f.write(f"{count:,} transaction(s)    Debits: Rs {cashit.rupees(debited)}    Credits: Rs {cashit.rupees(credited)}\n")
+    return count
+
+def export_statement(store, cnic, start, end, path=None):
+    """Write the statement; .txt paths get the text layout, anything else CSV.
+    Returns (path, transactions written, seconds)."""
+    started = time.perf_counter()
+    if cnic not in store:
+        raise ValueError(f"no account with CNIC {cnic}")
+    path = path or f"statement-{cnic}-{start}-{end}.csv"
+    write = write_statement_text if path.endswith(".txt") else write_statement_csv
+    count = write(path, store[cnic], start, end, cashit.statement(store, cnic, start, end))
+    return path, count, time.perf_counter() - started
+
+# ---------------- STANDING ORDERS ----------------
+
+def run_standing_orders(scheduler):
+    """Execute the due standing orders once.
+    Returns (runs, runs done, {reason: count} of the others, seconds)."""
+    started = time.perf_counter()
+    results = scheduler.run()
+    rejects = {}
+    for _, (status, _) in results:
+        if status != "ok":
+            rejects[status] = rejects.get(status, 0) + 1
+    return len(results), len(results) - sum(rejects.values()), rejects, time.perf_counter() - started
+
+def watch_standing_orders(store, every):
+    """Run the due standing orders every `every` seconds (once if None)"""
+    scheduler = cashit.StandingOrderScheduler(store)
+    while True:
+        total, done, rejects, elapsed = run_standing_orders(scheduler)
+        if total or every is None:
+            print_summary("STANDING ORDERS", total, done, rejects, elapsed)
+        if every is None:
+            return
+        time.sleep(every)
+
+# ---------------- BACKUPS ----------------
+
+def default_backup_path():
+    return os.path.join(BACKUP_DIR, time.strftime("cashit-%Y%m%d-%H%M%S.jsonl"))
+
+def backup(store, path):
+    """Back the store up from a background thread and wait for it.
+    Returns (accounts, checksum, seconds)."""
+    started = time.perf_counter()
+    thread = storage.start_backup(store, path)
+    thread.join()
+    if thread.error:
+        raise thread.error
+    return thread.result + (time.perf_counter() - started,)
+
+# ---------------- MAIN ----------------
+
+def main(argv):
+    every = None
+    if argv[:1] == ["standing-orders"] and len(argv) in (1, 3):
+        try:
+            every = float(argv[2]) if len(argv) == 3 and argv[1] == "--every" else None
+        except ValueError:
+            pass
+        if len(argv) == 3 and not (every and every > 0):
+            print(__doc__)
+            return 1
+    elif argv[:1] == ["archive"] and len(argv) <= 2:
+        try:
+            months = int(argv[1] if len(argv) == 2 else ARCHIVE_MONTHS)
+        except ValueError:
+            months = 0
+        if months < 1:
+            print(__doc__)
+            return 1
+    elif argv[:1] == ["verify-backup"] and len(argv) == 2:
+        try:
+            intact = storage.verify_backup(argv[1])
+        except (OSError, IndexError) as e:
+            print(f"❌ Could not verify {argv[1]}: {e}")
+            return 1
+        print(f"✓ {argv[1]} matches its checksum." if intact else f"❌ {argv[1]} does not match its checksum.")
+        return 0 if intact else 1
+    elif not (argv[:1] in (["payments"], ["payroll"], ["onboard"]) and len(argv) >= 2 or argv == ["rebuild-spending"]
+              or argv[:1] == ["backup"] and len(argv) <= 2
+              or argv[:1] == ["statement"] and len(argv) in (4, 5)):
+        print(__doc__)
+        return 1
+
+    store, status = cashit.open_store()
+    if status == "corrupted":
+        print("❌ Saved data is corrupted or invalid. Batch not run.")
+        return 1
+
+    if argv[0] == "rebuild-spending":
+        try:
+            rebuilt, elapsed = rebuild_spending(store)
+        except Exception as e:
+            print(f"❌ Rebuild failed: {e}")
+            return 1
+        finally:
+            store.close()
+        print(f"✓ Rebuilt spending totals for {rebuilt:,} account(s) in {elapsed:.3f} s")
+        return 0
+
+    if argv[0] == "statement":
+        try:
+            path, count, elapsed = export_statement(store, *argv[1:5])
+        except Exception as e:
+            print(f"❌ Statement failed: {e}")
+            return 1
+        finally:
+            store.close()
+        print(f"✓ Wrote {count:,} transaction(s) to {path} in {elapsed:.3f} s")
+        return 0
+
+    if argv[0] == "standing-orders":
+        try:
+            watch_standing_orders(store, every)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(f"❌ Standing orders failed, the failed batch was not saved: {e}")
+            return 1
+        finally:
+            store.close()
+        return 0
+
+    if argv[0] == "backup":
+        path = argv[1] if len(argv) == 2 else default_backup_path()
+        try:
+            accounts, checksum, elapsed = backup(store, path)
+        except Exception as e:
+            print(f"❌ Backup failed: {e}")
+            return 1
+        finally:
+            store.close()
+        print(f"✓ Backed up {accounts:,} account(s) to {path} in {elapsed:.3f} s (sha256 {checksum[:16]}…)")
+        return 0
+
+    if argv[0] == "archive":
+        try:
+            moved, cutoff, elapsed = archive_history(store, months)
+        except Exception as e:
+            print(f"❌ Archiving failed: {e}")
+            return 1
+        finally:
+            store.close()
+        print(f"✓ Archived {moved:,} transaction(s) from before {cutoff} in {elapsed:.3f} s")
+        return 0
+
+    path = argv[1]
+    if argv[0] == "onboard":
+        result_path = argv[2] if len(argv) > 2 else default_rejects_path(path)
+        run, title = run_onboarding, "ONBOARDING"
+    else:
+        result_path = argv[2] if len(argv) > 2 else default_result_path(path)
+        run, title = (run_payroll, "PAYROLL") if argv[0] == "payroll" else (run_payments, "BATCH PAYMENTS")
+    try:
+        total, accepted, rejects, elapsed = run(store, path, result_path)
+    except Exception as e:
+        print(f"❌ Batch failed, nothing was saved: {e}")
+        return 1
+    finally:
+        store.close()
+
+    print_summary(title, total, accepted, rejects, elapsed)
+    if argv[0] == "payroll" and rejects:
+        print("❌ Payroll not applied: fix the rejected rows and run it again.")
+    print(f"✓ {'Rejects' if argv[0] == 'onboard' else 'Results'} written to {result_path}\n")
+    return 1 if argv[0] == "payroll" and rejects else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
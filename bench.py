@@ -0,0 +1,362 @@
+"""Benchmarks of CashIt at scale, on a generated population of accounts.
+
+    python bench.py [--accounts 10000[,100000...]] [--transactions 20]
+                    [--backend json|binary|sqlite|both|all] [--seed 1] [--samples 1000]
+                    [--repeat 3] [--out bench_results.jsonl] [--dir PATH] [--keep]
+
+For each backend and account count, a deterministic generator (the same
+seed always gives the same accounts and histories) writes the accounts,
+with on average --transactions transactions each in the formats the app
+records, into a scratch directory ("binary" is the JSON backend with a
+binary snapshot, "both" is json and sqlite). Then it times:
+
+    load        opening the store (startup)
+    save        save_all(), the full snapshot / checkpoint
+    login       the account lookup and PIN check of the login screen
+    payment     a bill payment: deduct_balance() + add_transaction()
+    dashboard   rendering the dashboard of an account
+    admin_page  the first page of the admin's View All Users
+    admin_all   reading every page of the admin listing
+
+Each run appends one JSON line to the results file and is compared with
+the previous run of the same backend and size found there.
+"""
+
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import cashit
+import python as console
+import storage
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+OPTIONS = {
+    "accounts": "10000",
+    "transactions": "20",
+    "backend": "both",
+    "seed": "1",
+    "samples": "1000",
+    "repeat": "3",
+    "out": "bench_results.jsonl",
+    "dir": None,
+}
+
+# Generated histories cover the HISTORY_DAYS before HISTORY_END, a fixed
+# date so a seed gives the same data whenever it is run
+HISTORY_END = date(2025, 12, 31)
+HISTORY_DAYS = 180
+
+FIRST_NAMES = ("Muhammad", "Ahmed", "Ali", "Sara", "Ayesha", "Fatima", "Hassan", "Usman", "Zainab", "Bilal",
+               "Hina", "Omar", "Maryam", "Imran", "Sana", "Hamza", "Noor", "Asad", "Mahnoor", "Fahad")
+LAST_NAMES = ("Khan", "Ali", "Imran", "Ahmed", "Butt", "Sheikh", "Malik", "Qureshi", "Chaudhry", "Raza",
+              "Siddiqui", "Hussain", "Iqbal", "Mirza", "Javed", "Aslam", "Baig", "Farooq", "Anwar", "Nawaz")
+
+# (type, sign, weight) of generated transactions
+TRANSACTION_MIX = (
+    ("bill", -1, 35),
+    ("transfer", -1, 20),
+    ("challan", -1, 10),
+    ("tax", -1, 5),
+    ("transfer", 1, 20),
+    ("admin", 1, 10),
+)
+
+# ---------------- GENERATOR ----------------
+
+def generated_cnic(number):
+    digits = f"{4210100000000 + number * 7:013d}"
+    return f"{digits[:5]}-{digits[5:12]}-{digits[12]}"
+
+def generated_iban(number):
+    return f"PK36{number:020d}"
+
+def short_iban(iban):
+    # As the transfer screen abbreviates it in the description
+    return iban[:10] + "..." + iban[-4:]
+
+def generate_accounts(count, transactions, seed):
+    """Yield (account header, transactions) for `count` accounts, each with
+    0 to 2 * `transactions` transactions, oldest first"""
+    rng = random.Random(seed)
+    days = [HISTORY_END - timedelta(days=n) for n in range(HISTORY_DAYS, -1, -1)]
+    dates = [day.strftime("%b %d, %Y") for day in days]
+    times = [datetime(2000, 1, 1, minute // 60, minute % 60).strftime("%I:%M %p") for minute in range(24 * 60)]
+    kinds = [(kind, sign) for kind, sign, weight in TRANSACTION_MIX for _ in range(weight)]
+    minutes = len(dates) * len(times)
+
+    for number in range(count):
+        acc = {
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "cnic": generated_cnic(number),
+            "iban": generated_iban(number),
+            "pin": f"{rng.randrange(10000):04d}",
+            "balance": cashit.OPENING_BONUS,
+            "savings": rng.randrange(0, 500000) * 100,
+            "monthly_spending": 0,
+            "version": 0,
+            "spending": {},
+        }
+
+        history = []
+        for moment in sorted(rng.randrange(minutes) for _ in range(rng.randint(0, 2 * transactions))):
+            kind, sign = rng.choice(kinds)
+            if sign < 0:
+                amount = rng.randrange(100, 25000) * 100
+                if amount > acc["balance"]:
+                    kind, sign = "transfer", 1   # the app would refuse the debit; they got paid instead
+            if sign > 0:
+                amount = rng.randrange(5000, 150000) * 100
+
+            if kind == "transfer":
+                other = generated_iban(rng.randrange(count))
+                description = f"Transfer to {short_iban(other)}" if sign < 0 else f"Transfer from {acc['name']}"
+            elif kind == "admin":
+                description = "Admin Credit"
+            else:
+                description = cashit.describe_payment(kind, rng.randrange(10**9, 10**10))
+
+            acc["balance"] += sign * amount
+            t = storage.make_transaction(
+                description, dates[moment // len(times)], times[moment % len(times)], amount, sign, kind, acc["balance"]
+            )
+            storage.add_spending(acc, t)
+            history.append(t)
+
+        yield acc, history
+
+def open_backend(kind, directory):
+    if kind in ("json", "binary"):
+        return storage.JsonBackend(
+            os.path.join(directory, "users.json"), os.path.join(directory, "users.journal"), kind
+        )
+    return storage.SqliteBackend(os.path.join(directory, "cashit.db"))
+
+def disk_usage(directory):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(directory) for name in names
+    )
+
+# ---------------- MEASUREMENT ----------------
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+def summarize(seconds):
+    """Latency statistics (milliseconds) of a list of timings"""
+    ordered = sorted(seconds)
+    total = sum(ordered)
+    return {
+        "runs": len(ordered),
+        "total_s": round(total, 6),
+        "mean_ms": round(total / len(ordered) * 1000, 4),
+        "median_ms": round(percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+        "ops_per_s": round(len(ordered) / total, 2) if total else None,
+    }
+
+def timed(operation, *args, **kwargs):
+    started = time.perf_counter()
+    operation(*args, **kwargs)
+    return time.perf_counter() - started
+
+def login_lookup(store, cnic, pin):
+    # What login() does between reading the PIN and greeting the user
+    store.refresh()
+    return cnic in store and store[cnic]["pin"] == pin
+
+def render(screen, *args, answers=()):
+    console.bind_terminal(console.ScriptedTerminal(answers))
+    try:
+        with console.screen():
+            screen(*args)
+    except EOFError:
+        pass
+    finally:
+        console.bind_terminal(console.CONSOLE)
+
+def list_everyone(store):
+    return sum(len(page) for page in cashit.find_accounts(store))
+
+def run_benchmark(kind, accounts, transactions, seed, samples, repeat, directory):
+    """Generate a dataset in `directory` and time the operations on it.
+    Returns the result record."""
+    results = {}
+
+    started = time.perf_counter()
+    store = open_backend(kind, directory)
+    store.load(cashit.get_default_users())
+    total = [0]
+
+    def counted(entries):
+        for acc, history in entries:
+            total[0] += len(history)
+            yield acc, history
+
+    store.import_accounts(counted(generate_accounts(accounts, transactions, seed)))
+    store.close()
+    results["generate"] = summarize([time.perf_counter() - started])
+
+    timings = []
+    for _ in range(repeat):
+        store = open_backend(kind, directory)
+        timings.append(timed(store.load, {}))
+        if len(timings) < repeat:
+            store.close()
+    results["load"] = summarize(timings)
+
+    console.USERS = store
+    rng = random.Random(seed + 1)
+    picks = [generated_cnic(rng.randrange(accounts)) for _ in range(samples)]
+    pins = [store[cnic]["pin"] for cnic in picks]
+    # Looked up again on a fresh store, so SQLite's header cache starts cold
+    store.close()
+    store = open_backend(kind, directory)
+    store.load({})
+    console.USERS = store
+
+    results["login"] = summarize([timed(login_lookup, store, cnic, pin) for cnic, pin in zip(picks, pins)])
+    results["dashboard"] = summarize([timed(render, console.show_dashboard, store[cnic]) for cnic in picks])
+    results["payment"] = summarize([
+        timed(cashit.pay, store, store[cnic], 100, cashit.describe_payment("bill", number), "bill")
+        for number, cnic in enumerate(picks)
+    ])
+    results["admin_page"] = summarize([
+        timed(render, console.browse_users, answers=["1", "q"]) for _ in range(repeat)
+    ])
+    results["admin_all"] = summarize([timed(list_everyone, store) for _ in range(repeat)])
+    results["save"] = summarize([timed(store.save_all) for _ in range(repeat)])
+    store.close()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": kind,
+        "accounts": accounts,
+        "transactions_per_account": transactions,
+        "transactions": total[0],
+        "seed": seed,
+        "disk_bytes": disk_usage(directory),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+        "results": results,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+# ---------------- RESULTS ----------------
+
+def previous_record(path, record):
+    """The latest earlier run in `path` with the same backend and dataset"""
+    same = ("backend", "accounts", "transactions_per_account", "seed")
+    previous = None
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    earlier = json.loads(line)
+                except ValueError:
+                    continue
+                if all(earlier.get(key) == record[key] for key in same):
+                    previous = earlier
+    return previous
+
+def print_record(record, previous):
+    print("\n" + "="*72)
+    print(f"   {record['backend'].upper()} — {record['accounts']:,} accounts, "
+          f"{record['transactions']:,} transactions, {record['disk_bytes'] / 2**20:,.1f} MB on disk")
+    print("="*72)
+    print(f"   {'operation':<12}{'runs':>7}{'median ms':>12}{'p95 ms':>12}{'ops/s':>12}{'vs last':>12}")
+    for name, stats in record["results"].items():
+        change = ""
+        before = previous and previous["results"].get(name)
+        if before and before["median_ms"]:
+            change = f"{(stats['median_ms'] / before['median_ms'] - 1) * 100:+.1f}%"
+        ops = stats["ops_per_s"]
+        ops = "-" if not ops else f"{ops:,.0f}" if ops >= 10 else f"{ops:.2f}"
+        print(f"   {name:<12}{stats['runs']:>7}{stats['median_ms']:>12,.3f}{stats['p95_ms']:>12,.3f}{ops:>12}{change:>12}")
+    print("="*72)
+
+# ---------------- MAIN ----------------
+
+def parse_options(argv):
+    """--name value pairs (and --keep) over OPTIONS; None if they are invalid"""
+    options = dict(OPTIONS, keep=False)
+    argv = list(argv)
+    while argv:
+        name = argv.pop(0)
+        if name == "--keep":
+            options["keep"] = True
+        elif name.startswith("--") and name[2:] in OPTIONS and argv:
+            options[name[2:]] = argv.pop(0)
+        else:
+            return None
+
+    try:
+        options["accounts"] = [int(count) for count in options["accounts"].split(",")]
+        for name in ("transactions", "seed", "samples", "repeat"):
+            options[name] = int(options[name])
+    except ValueError:
+        return None
+    backends = {
+        "json": ["json"], "binary": ["binary"], "sqlite": ["sqlite"],
+        "both": ["json", "sqlite"], "all": ["json", "binary", "sqlite"],
+    }.get(options["backend"])
+    if backends is None or min(options["accounts"]) < 1 or options["samples"] < 1 or options["repeat"] < 1:
+        return None
+    options["backend"] = backends
+    return options
+
+def main(argv):
+    options = parse_options(argv)
+    if options is None:
+        print(__doc__)
+        return 1
+
+    for accounts in options["accounts"]:
+        for kind in options["backend"]:
+            directory = tempfile.mkdtemp(prefix=f"cashit-bench-{kind}-", dir=options["dir"])
+            print(f"⏳ {kind}: generating {accounts:,} accounts in {directory} ...")
+            try:
+                record = run_benchmark(
+                    kind, accounts, options["transactions"], options["seed"],
+                    options["samples"], options["repeat"], directory
+                )
+            except Exception as e:
+                print(f"❌ Benchmark failed: {e}")
+                return 1
+            finally:
+                if not options["keep"]:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+            print_record(record, previous_record(options["out"], record))
+            with open(options["out"], "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    print(f"\n✓ Results appended to {options['out']}\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
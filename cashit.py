@@ -0,0 +1,879 @@
+"""CashIt banking core: accounts, validation and payments over an explicit store.
+
+Importing this module has no side effects. Nothing is read from disk until
+open_store() is called, and no function here prints or prompts, so the same
+logic can back the console app, batch jobs and benchmarks.
+"""
+
+import calendar
+import functools
+import heapq
+import random
+import re
+import time
+from datetime import date, datetime, timedelta
+from decimal import InvalidOperation
+
+import metrics
+import storage
+
+ADMIN_CNIC = "00000-0000000-0"
+OPENING_BONUS = 500 * 100          # paisa
+LARGE_TRANSFER = 1000000 * 100     # transfers above this ask for an extra confirmation
+
+# Transaction descriptions for each kind of payment, given its reference
+PAYMENT_DESCRIPTIONS = {
+    "bill": "Bill Payment - ID {}",
+    "tax": "Tax Payment - Ref {}",
+    "challan": "Challan Payment - {}",
+}
+# A challan is paid once; paying a bill or tax reference again within
+# DUPLICATE_WINDOW_DAYS of the last payment asks for confirmation first
+REJECT_DUPLICATES = ("challan",)
+DUPLICATE_WINDOW_DAYS = 30
+# Standing orders: the payment kinds above, a transfer to an IBAN, or an
+# incoming credit (e.g. a salary) whose reference is its description
+STANDING_ORDER_KINDS = ("bill", "tax", "transfer", "credit")   # a challan is paid once, so never a standing order
+SCHEDULES = ("daily", "weekly", "monthly")
+WEAK_PINS = ["0000", "1234", "1111", "2222", "9999", "9876", "5678"]
+PAGE_SIZE = 20         # accounts per page in admin listings
+COMMIT_ATTEMPTS = 10       # tries before giving up on an account other processes keep changing
+RETRY_BACKOFF = 0.002      # seconds; the random wait before a retry doubles each time
+
+# ---------------- ACCOUNT DATABASE ----------------
+
+def get_default_users():
+    return {
+        # -------- ADMIN --------
+        "00000-0000000-0": {
+            "name": "ADMIN",
+            "cnic": "00000-0000000-0",
+            "iban": None,
+            "pin": "0000",
+            "balance": 0,
+            "savings": 0,
+            "monthly_spending": 0,
+            "transactions": []
+        },
+
+        "35202-9823471-2": {
+            "name": "Muhammad Ali",
+            "cnic": "35202-9823471-2",
+            "iban": "PK11 1111 1111 1111 1111",
+            "pin": "1234",
+            "balance": 1245500 * 100,
+            "savings": 450000 * 100,
+            "monthly_spending": 85200 * 100,
+            "transactions": [
+                ("Netflix Subscription", "Dec 02, 2025", "-1500"),
+                ("Salary Credit", "Dec 01, 2025", "+350000"),
+                ("Carrefour Grocery", "Nov 28, 2025", "-24350"),
+                ("LESCO Bill", "Nov 25, 2025", "-18200"),
+            ]
+        },
+
+        "35202-9876543-1": {
+            "name": "Sara Imran",
+            "cnic": "35202-9876543-1",
+            "iban": "PK33 3333 3333 3333 3333",
+            "pin": "9999",
+            "balance": 965200 * 100,
+            "savings": 42000 * 100,
+            "monthly_spending": 32200 * 100,
+            "transactions": [
+                ("UET Fee", "Dec 22, 2025", "-100500"),
+                ("Salary Credit", "Dec 20, 2025", "+350000"),
+                ("Chezious Bill", "Dec 19, 2025", "-4350"),
+                ("Income Tax", "Dec 25, 2025", "-3200"),
+            ]
+        },
+
+        "35202-1234567-9": {
+            "name": "Ahmed Khan",
+            "cnic": "35202-1234567-9",
+            "iban": "PK22 2222 2222 2222 2222",
+            "pin": "5678",
+            "balance": 132500 * 100,
+            "savings": 20000 * 100,
+            "monthly_spending": 5200 * 100,
+            "transactions": [
+                ("Gas Bill", "Dec 21, 2025", "-1500"),
+                ("Salary Credit", "Dec 14, 2025", "+50000"),
+                ("PTCL Bill", "Dec 11, 2025", "-2350"),
+                ("E-Challan", "Dec 05, 2025", "-2000"),
+            ]
+        }
+    }
+
+# ---------------- MONEY ----------------
+# Amounts are integer paisa everywhere (Rs 1 = 100 paisa); rupees only
+# appear when reading user input and when displaying.
+
+def parse_amount(text):
+    """Parse a rupee amount typed by the user, e.g. "5000.50", into paisa"""
+    try:
+        return storage.to_paisa(text)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"invalid amount: {text!r}")
+
+def check_amount(amount):
+    """Raise ValueError unless `amount` (paisa) is positive"""
+    if amount <= 0:
+        raise ValueError("amount must be greater than zero")
+
+def rupees(paisa):
+    """Format paisa for display: 150050 -> "1,500.50" """
+    whole, cents = divmod(abs(paisa), 100)
+    return f"{'-' if paisa < 0 else ''}{whole:,}.{cents:02d}"
+
+@metrics.timed("load")
+def open_store(kind=None):
+    """Open the configured storage backend, seeded with the default accounts.
+    Returns (store, status) where status is "loaded", "new" or "corrupted"."""
+    store = storage.open_backend(kind)
+    status = store.load(get_default_users())
+    return store, status
+
+# ---------------- VALIDATION FUNCTIONS ----------------
+# Compiled once: the bulk importer runs them on every row of a file
+
+CNIC_PATTERN = re.compile(r"[0-9]{5}-[0-9]{7}-[0-9]")
+IBAN_PATTERN = re.compile(r"PK[0-9]{20,24}")     # 22 to 26 characters without spaces
+PIN_PATTERN = re.compile(r"[0-9]{4}")
+NAME_DIGIT = re.compile(r"\d")
+
+def validate_cnic(cnic):
+    return CNIC_PATTERN.fullmatch(cnic.strip()) is not None
+
+def validate_iban(iban):
+    return IBAN_PATTERN.fullmatch(iban.replace(" ", "").upper()) is not None
+
+def validate_pin(pin):
+    return PIN_PATTERN.fullmatch(pin.strip()) is not None
+
+def validate_name(name):
+    name = name.strip()
+    return len(name) >= 3 and NAME_DIGIT.search(name) is None
+
+def is_weak_pin(pin):
+    return pin in WEAK_PINS
+
+# ---------------- CONCURRENCY ----------------
+
+def retry_on_conflict(operation):
+    """Run a write against up-to-date accounts, re-running it if another
+    process commits one of its accounts between our read and our write.
+    The failed attempt has already undone its in-memory changes."""
+    @functools.wraps(operation)
+    def run(store, *args, **kwargs):
+        for attempt in range(COMMIT_ATTEMPTS):
+            store.refresh()
+            try:
+                return operation(store, *args, **kwargs)
+            except storage.VersionConflict:
+                metrics.count("conflict_retries", operation=operation.__name__)
+                if attempt == COMMIT_ATTEMPTS - 1:
+                    raise
+            # Random, growing waits keep writers of a busy account from colliding again
+            time.sleep(random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+    return run
+
+# ---------------- ACCOUNTS ----------------
+
+@metrics.timed("open_account")
+@retry_on_conflict
+def open_account(store, cnic, name, iban, pin):
+    """Create and persist a new account with the opening bonus.
+    Returns None if the CNIC or IBAN was taken in the meantime."""
+    acc = new_account(cnic, name, iban, pin)
+    with store.locked(cnic), store.commit_lock:
+        if cnic in store or store.find_iban(iban):
+            return None
+        store.put_account(acc)
+    return acc
+
+def new_account(cnic, name, iban, pin):
+    """The header of a new account, holding the opening bonus"""
+    return {
+        "name": name.strip().title(),
+        "cnic": cnic.strip(),
+        "iban": storage.iban_key(iban),
+        "pin": pin.strip(),
+        "balance": OPENING_BONUS,
+        "savings": 0,
+        "monthly_spending": 0,
+        "version": 0,
+        "spending": {},
+        "recent": []
+    }
+
+def check_new_account(cnic, name, iban, pin):
+    """Why a new account's details are invalid ("invalid_cnic", "invalid_name",
+    "invalid_iban" or "invalid_pin"), or None if they are valid"""
+    if not validate_cnic(cnic):
+        return "invalid_cnic"
+    if not validate_name(name):
+        return "invalid_name"
+    if not validate_iban(iban):
+        return "invalid_iban"
+    if not validate_pin(pin):
+        return "invalid_pin"
+    return None
+
+@metrics.timed("onboard")
+def onboard_accounts(store, rows):
+    """Open an account, with the opening bonus, for each (cnic, name, iban,
+    pin) row, e.g. read from an onboarding file.
+
+    Rows are checked in a single pass as they are read, with duplicates
+    caught through sets of the CNICs and IBANs seen so far. The store is then
+    asked about all the remaining CNICs and IBANs at once, and every valid
+    account is committed in one write. Returns one status per row: "ok",
+    a check_new_account() reason, "duplicate_cnic" or "duplicate_iban" (held
+    by an existing account or an earlier row; the ADMIN CNIC always is)."""
+    statuses = []
+    candidates = []    # (row number, account header)
+    seen_cnics = {ADMIN_CNIC}
+    seen_ibans = set()
+    for cnic, name, iban, pin in rows:
+        status = check_new_account(cnic, name, iban, pin)
+        if status is None:
+            acc = new_account(cnic, name, iban, pin)
+            if acc["cnic"] in seen_cnics:
+                status = "duplicate_cnic"
+            elif acc["iban"] in seen_ibans:
+                status = "duplicate_iban"
+            else:
+                status = "ok"
+                seen_cnics.add(acc["cnic"])
+                seen_ibans.add(acc["iban"])
+                candidates.append((len(statuses), acc))
+        statuses.append(status)
+
+    if candidates:
+        for number, status in import_new_accounts(store, candidates).items():
+            statuses[number] = status
+    return statuses
+
+@retry_on_conflict
+def import_new_accounts(store, candidates):
+    """Commit, in one write, those of the (row number, account header)
+    candidates whose CNIC and IBAN are free. Returns {row number:
+    "duplicate_cnic" or "duplicate_iban"} for the others. An account another
+    process opens meanwhile makes the write fail, and the check run again."""
+    duplicates = {}
+    with store.commit_lock:
+        taken_cnics = store.existing([acc["cnic"] for _, acc in candidates])
+        taken_ibans = set(store.find_ibans([acc["iban"] for _, acc in candidates]))
+        accounts = []
+        for number, acc in candidates:
+            if acc["cnic"] in taken_cnics:
+                duplicates[number] = "duplicate_cnic"
+            elif acc["iban"] in taken_ibans:
+                duplicates[number] = "duplicate_iban"
+            else:
+                accounts.append((acc, []))
+        if accounts:
+            store.import_accounts(accounts)
+    return duplicates
+
+def find_accounts(store, text="", anywhere=False, page_size=PAGE_SIZE):
+    """Yield pages (lists of account headers) of the accounts whose CNIC or
+    name starts with `text` (contains it, if `anywhere`), in sorted order.
+    An empty text lists everyone by CNIC. Pages are produced as they are
+    read, so the first one is ready however many accounts exist."""
+    page = []
+    for cnic, acc in store.search(text.strip(), anywhere):
+        page.append(acc)
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+@metrics.timed("change_pin")
+@retry_on_conflict
+def change_pin(store, acc, new_pin):
+    with store.locked(acc["cnic"]), store.commit_lock:
+        old_pin = acc["pin"]
+        acc["pin"] = new_pin
+        try:
+            store.put_account(acc)
+        except Exception:
+            acc["pin"] = old_pin
+            raise
+    return True
+
+@metrics.timed("admin_delete")
+@retry_on_conflict
+def delete_account(store, cnic):
+    """Remove an account. The ADMIN account cannot be deleted."""
+    if cnic == ADMIN_CNIC or cnic not in store:
+        return False
+    with store.locked(cnic):
+        store.delete_account(cnic)
+    return True
+
+# ---------------- TRANSACTIONS ----------------
+
+def build_transaction(acc, description, amount, transaction_type="debit", sign=-1, reference=None):
+    now = datetime.now()
+    return storage.make_transaction(
+        description,
+        now.strftime("%b %d, %Y"),
+        now.strftime("%I:%M %p"),
+        amount,
+        sign,
+        transaction_type,
+        acc["balance"],
+        reference
+    )
+
+def post_transactions(store, postings, headers=()):
+    """Apply (acc, amount, description, transaction_type, sign[, reference])
+    postings as one unit. `sign` is +1 for a credit and -1 for a debit.
+
+    Balances are updated, transactions appended and everything is persisted
+    in a single write, along with the other header fields the caller changed
+    in the accounts of `headers`. If the write fails the balances and recent
+    transactions are restored and the error is re-raised. The caller must
+    hold the accounts' locks."""
+    saved = [(acc, acc["balance"], list(acc["recent"]), acc["monthly_spending"]) for acc, *_ in postings]
+    entries = []
+
+    with store.commit_lock:
+        for acc, amount, description, transaction_type, sign, *reference in postings:
+            acc["balance"] += sign * amount
+            entry = build_transaction(acc, description, amount, transaction_type, sign, *reference)
+            storage.push_recent(acc, entry)
+            storage.add_spending(acc, entry)
+            entries.append((acc, entry))
+
+        try:
+            if len(entries) == 1 and not headers:
+                store.add_transaction(*entries[0])
+            else:
+                store.add_transactions(entries, headers)
+        except Exception:
+            for acc, entry in reversed(entries):
+                storage.add_spending(acc, entry, -1)
+            for acc, balance, recent, monthly_spending in reversed(saved):
+                acc["balance"] = balance
+                acc["recent"] = recent
+                acc["monthly_spending"] = monthly_spending
+            raise
+
+    return [entry for _, entry in entries]
+
+def deduct_balance(acc, amount):
+    """Debit `amount` if the balance covers it; returns False otherwise.
+    The change is persisted by the add_transaction() that follows it."""
+    if acc["balance"] < amount:
+        return False
+    acc["balance"] -= amount
+    return True
+
+def add_transaction(store, acc, description, amount, transaction_type="debit", sign=-1, reference=None):
+    """Record and persist a transaction for a balance change already applied to `acc`"""
+    entry = build_transaction(acc, description, amount, transaction_type, sign, reference)
+    recent = list(acc["recent"])
+    monthly_spending = acc["monthly_spending"]
+    with store.commit_lock:
+        storage.push_recent(acc, entry)
+        storage.add_spending(acc, entry)
+        try:
+            store.add_transaction(acc, entry)
+        except Exception:
+            storage.add_spending(acc, entry, -1)
+            acc["recent"] = recent
+            acc["monthly_spending"] = monthly_spending
+            raise
+    return entry
+
+# ---------------- SPENDING ----------------
+# Read from the running totals each debit updates, never from the history
+
+def current_month():
+    return datetime.now().strftime("%Y-%m")
+
+def spending_by_type(acc, month=None):
+    """{type: paisa} an account spent in a calendar month (default: this one)"""
+    return acc.get("spending", {}).get(month or current_month(), {})
+
+def monthly_spending(acc, month=None):
+    return sum(spending_by_type(acc, month).values())
+
+@metrics.timed("admin_spending_report")
+def spending_report(store, month=None):
+    """Spending of every account in a month, totalled per type"""
+    totals = {}
+    for cnic, acc in store.items():
+        for kind, amount in spending_by_type(acc, month).items():
+            totals[kind] = totals.get(kind, 0) + amount
+    return totals
+
+@retry_on_conflict
+def rebuild_spending(store, cnic):
+    """Recompute an account's spending totals from its full history,
+    e.g. for accounts created before the totals were kept"""
+    with store.locked(cnic), store.commit_lock:
+        acc = store[cnic]
+        saved = acc.get("spending", {}), acc["monthly_spending"]
+        acc["spending"] = {}
+        acc["monthly_spending"] = 0
+        for transaction in store.history(cnic):
+            storage.add_spending(acc, transaction)
+        try:
+            store.put_account(acc)
+        except Exception:
+            acc["spending"], acc["monthly_spending"] = saved
+            raise
+    return acc
+
+def get_history(store, acc):
+    """The account's full transaction history, read from storage on demand"""
+    return store.history(acc["cnic"])
+
+def statement(store, cnic, start, end):
+    """Lazily yield the account's transactions from `start` to `end`
+    ("YYYY-MM-DD", both days included), oldest first"""
+    for day in (start, end):
+        datetime.strptime(day, "%Y-%m-%d")   # ValueError if it is not a date
+    if start > end:
+        raise ValueError(f"{start} is after {end}")
+    return store.transactions_between(cnic, f"{start} 00:00", f"{end} 23:59")
+
+# ---------------- SCREEN DATA ----------------
+# What the dashboard and a payment receipt show, as plain dicts (amounts
+# in paisa): rendered as text by the console, or printed as JSON for scripts
+
+def dashboard(acc):
+    return {
+        "name": acc["name"],
+        "cnic": acc["cnic"],
+        "iban": acc["iban"],
+        "balance": acc["balance"],
+        "savings": acc["savings"],
+        "monthly_spending": monthly_spending(acc),
+        "spending_by_type": {kind: amount for kind, amount in sorted(spending_by_type(acc).items()) if amount},
+        "recent": [t._asdict() for t in acc["recent"]],
+    }
+
+def receipt(acc, amount, transaction, error=None):
+    """Outcome of a payment: status "ok", "insufficient_balance", "duplicate",
+    "unknown_account" (deleted meanwhile) or "failed" (the last three with
+    the error). The amount is None for a duplicate caught before it was asked."""
+    if isinstance(error, DuplicatePayment):
+        status = "duplicate"
+    elif isinstance(error, storage.AccountGone):
+        status = "unknown_account"
+    else:
+        status = "failed" if error else "ok" if transaction else "insufficient_balance"
+    record = {
+        "status": status,
+        "amount": amount,
+        "balance": acc["balance"],
+        "transaction": transaction._asdict() if transaction else None,
+    }
+    if error:
+        record["error"] = str(error)
+    return record
+
+# ---------------- PAYMENTS ----------------
+
+class DuplicatePayment(Exception):
+    """A challan (or other REJECT_DUPLICATES kind) that was already paid;
+    `payment` is the (cnic, transaction) that paid it"""
+
+    def __init__(self, kind, reference, payment):
+        super().__init__(f"{kind.capitalize()} {reference} was already paid on {payment[1].date}")
+        self.payment = payment
+
+@metrics.timed("payment", "transaction_type")
+@retry_on_conflict
+def pay(store, acc, amount, description, transaction_type="debit", reference=None):
+    """Debit and record a bill, tax, challan or external transfer payment,
+    with the reference it pays, if any.
+    Returns the transaction, or None if the balance is insufficient. Raises
+    DuplicatePayment for a challan already paid, checked under the commit
+    lock so two sessions paying it at once cannot both succeed, and
+    ValueError for an amount that is not positive."""
+    check_amount(amount)
+    with store.locked(acc["cnic"]), store.commit_lock:
+        if transaction_type in REJECT_DUPLICATES and reference is not None:
+            payment = store.last_payment(transaction_type, reference)
+            if payment:
+                raise DuplicatePayment(transaction_type, reference, payment)
+        if not deduct_balance(acc, amount):
+            return None
+        try:
+            return add_transaction(store, acc, description, amount, transaction_type, reference=reference)
+        except Exception:
+            acc["balance"] += amount
+            raise
+
+def describe_payment(kind, reference):
+    return PAYMENT_DESCRIPTIONS[kind].format(reference)
+
+def earlier_payment(store, kind, reference):
+    """The (cnic, transaction) that makes paying `reference` again a
+    duplicate: its last payment for a challan, or one within
+    DUPLICATE_WINDOW_DAYS for a bill or tax. None if there is none."""
+    store.refresh()   # payments other processes committed
+    payment = store.last_payment(kind, reference)
+    if payment is None or kind in REJECT_DUPLICATES:
+        return payment
+    since = (date.today() - timedelta(days=DUPLICATE_WINDOW_DAYS)).isoformat()
+    return payment if payment[1].timestamp >= since else None
+
+def find_payments(store, kind, reference):
+    """Every (account header, transaction) that paid `reference`, oldest first"""
+    store.refresh()
+    return [(store[cnic], t) for cnic, t in store.find_payments(kind, reference.strip()) if cnic in store]
+
+@metrics.timed("payment_batch")
+@retry_on_conflict
+def pay_batch(store, payments):
+    """Apply many (cnic, kind, reference, amount) bill/tax/challan payments,
+    committing every accepted one in a single write.
+
+    Each row gets the same balance check as an interactive payment, in
+    order, so an account can cover several rows until its balance runs out.
+    A challan already paid (before or earlier in the batch) is rejected.
+    Rejected rows do not affect the rest. Returns one (status, transaction)
+    pair per row, where status is "ok", "unknown_account", "admin_account",
+    "invalid_kind", "invalid_amount", "duplicate" or "insufficient_balance"."""
+    cnics = {cnic for cnic, _, _, _ in payments if cnic in store and cnic != ADMIN_CNIC}
+    results = []
+    postings = []
+    paid = set()   # (kind, reference) of the accepted rows
+
+    with store.locked(*cnics):
+        balances = {cnic: store[cnic]["balance"] for cnic in cnics}
+
+        for cnic, kind, reference, amount in payments:
+            if cnic == ADMIN_CNIC:
+                status = "admin_account"
+            elif cnic not in cnics:
+                status = "unknown_account"
+            elif kind not in PAYMENT_DESCRIPTIONS:
+                status = "invalid_kind"
+            elif amount <= 0:
+                status = "invalid_amount"
+            elif kind in REJECT_DUPLICATES and ((kind, reference) in paid or store.last_payment(kind, reference)):
+                status = "duplicate"
+            elif balances[cnic] < amount:
+                status = "insufficient_balance"
+            else:
+                status = "ok"
+                balances[cnic] -= amount
+                paid.add((kind, reference))
+                postings.append((store[cnic], amount, describe_payment(kind, reference), kind, -1, reference))
+            results.append(status)
+
+        transactions = post_transactions(store, postings) if postings else []
+
+    committed = iter(transactions)
+    return [(status, next(committed) if status == "ok" else None) for status in results]
+
+@metrics.timed("payroll")
+@retry_on_conflict
+def payroll_credit(store, rows):
+    """Credit many (account, amount, description) rows all-or-nothing, e.g.
+    a month's salaries. `account` is a CNIC or an IBAN; an amount of None
+    stands for one that could not be read.
+
+    Every row is checked before anything changes. If all are valid, the
+    credits are applied and committed in a single write (undone entirely
+    if it fails); if any is not, nothing is applied. Returns one (status,
+    transaction) pair per row, where status is "ok", "unknown_account",
+    "admin_account", "invalid_amount", or "not_applied" for a valid row of
+    a run that was refused."""
+    # Accounts are looked up together rather than row by row
+    by_cnic = [validate_cnic(account) for account, _, _ in rows]
+    owners = store.find_ibans([account for (account, _, _), cnic in zip(rows, by_cnic) if not cnic])
+    cnics = [account if cnic else owners.get(account) for (account, _, _), cnic in zip(rows, by_cnic)]
+    accounts = store.headers([cnic for cnic in cnics if cnic and cnic != ADMIN_CNIC])
+
+    statuses = []
+    postings = []
+    for (account, amount, description), cnic in zip(rows, cnics):
+        if cnic == ADMIN_CNIC:
+            status = "admin_account"
+        elif cnic not in accounts:
+            status = "unknown_account"
+        elif amount is None or amount <= 0:
+            status = "invalid_amount"
+        else:
+            status = "ok"
+            postings.append((accounts[cnic], amount, description, "credit", 1))
+        statuses.append(status)
+
+    if len(postings) < len(rows):
+        return [(status if status != "ok" else "not_applied", None) for status in statuses]
+    if not postings:
+        return []
+
+    with store.locked(*{acc["cnic"] for acc, *_ in postings}):
+        return [("ok", transaction) for transaction in post_transactions(store, postings)]
+
+@retry_on_conflict
+def transfer(store, acc, amount, iban, description):
+    """Send money to an IBAN. If it belongs to a CashIt account that account
+    is credited, and both sides are committed together.
+    Returns the sender's transaction, or None if the balance is insufficient."""
+    check_amount(amount)
+    receiver_cnic = store.find_iban(iban)
+    if receiver_cnic is None:
+        return pay(store, acc, amount, description, "transfer")
+    if receiver_cnic == acc["cnic"]:
+        raise ValueError("cannot transfer to your own account")
+
+    receiver = store[receiver_cnic]
+    # Transfers to other banks are timed by pay(), under the same name
+    with metrics.timer("payment_transfer"), store.locked(acc["cnic"], receiver_cnic):
+        if acc["balance"] < amount:
+            return None
+        return post_transactions(store, [
+            (acc, amount, description, "transfer", -1),
+            (receiver, amount, f"Transfer from {acc['name']}", "transfer", 1),
+        ])[0]
+
+@metrics.timed("admin_adjust")
+@retry_on_conflict
+def admin_adjust_balance(store, user, amount, credit=True):
+    """Credit or debit an account from the admin console.
+    Returns the transaction, or None if a debit exceeds the balance."""
+    check_amount(amount)
+    with store.locked(user["cnic"]):
+        if not credit and user["balance"] < amount:
+            return None
+        action = "Admin Credit" if credit else "Admin Deduction"
+        sign = 1 if credit else -1
+        return post_transactions(store, [(user, amount, action, "admin", sign)])[0]
+
+# ---------------- STANDING ORDERS ----------------
+# A standing order repeats a payment, transfer or credit on a schedule. It
+# is kept in the account header as {"id", "kind", "reference", "amount",
+# "every", "day", "next"}: `next` is the date ("YYYY-MM-DD") of its next
+# run and `day` the day of the month monthly orders run on.
+
+def find_standing_order(acc, order_id):
+    for order in acc.get("standing_orders", ()):
+        if order["id"] == order_id:
+            return order
+    return None
+
+def next_run(order, day):
+    """The run date that follows `day` ("YYYY-MM-DD") in the order's schedule"""
+    current = date.fromisoformat(day)
+    if order["every"] == "daily":
+        following = current + timedelta(days=1)
+    elif order["every"] == "weekly":
+        following = current + timedelta(weeks=1)
+    else:
+        # The order's day of the next month, or that month's last day if it is shorter
+        year, month = divmod(current.year * 12 + current.month, 12)
+        month += 1
+        following = date(year, month, min(order["day"], calendar.monthrange(year, month)[1]))
+    return following.isoformat()
+
+@metrics.timed("standing_order_add")
+@retry_on_conflict
+def add_standing_order(store, acc, kind, reference, amount, every, first=None):
+    """Set up a standing order whose first run is on `first` ("YYYY-MM-DD",
+    default today). For a transfer the reference is the receiver's IBAN,
+    for a credit its description. Returns the order; raises ValueError if
+    it is invalid."""
+    start = datetime.strptime(first, "%Y-%m-%d").date() if first else date.today()
+    reference = reference.strip()
+    if acc["cnic"] == ADMIN_CNIC:
+        raise ValueError("the ADMIN account cannot have standing orders")
+    if kind not in STANDING_ORDER_KINDS:
+        raise ValueError(f"unknown standing order kind: {kind}")
+    if every not in SCHEDULES:
+        raise ValueError(f"unknown schedule: {every}")
+    check_amount(amount)
+    if not reference:
+        raise ValueError("reference cannot be empty")
+    if kind == "transfer":
+        reference = reference.upper().replace(" ", "")
+        if store.find_iban(reference) == acc["cnic"]:
+            raise ValueError("cannot transfer to your own account")
+
+    with store.locked(acc["cnic"]), store.commit_lock:
+        orders = acc.get("standing_orders", [])
+        order = {
+            "id": max((o["id"] for o in orders), default=0) + 1,
+            "kind": kind,
+            "reference": reference,
+            "amount": amount,
+            "every": every,
+            "day": start.day,
+            "next": start.isoformat(),
+        }
+        acc["standing_orders"] = orders + [order]
+        try:
+            store.put_account(acc)
+        except Exception:
+            acc["standing_orders"] = orders
+            raise
+    return order
+
+@metrics.timed("standing_order_cancel")
+@retry_on_conflict
+def cancel_standing_order(store, acc, order_id):
+    """Remove a standing order; returns False if the account has no such order"""
+    with store.locked(acc["cnic"]), store.commit_lock:
+        orders = acc.get("standing_orders", [])
+        if find_standing_order(acc, order_id) is None:
+            return False
+        acc["standing_orders"] = [o for o in orders if o["id"] != order_id]
+        try:
+            store.put_account(acc)
+        except Exception:
+            acc["standing_orders"] = orders
+            raise
+    return True
+
+def standing_order_postings(store, acc, order, receivers):
+    """The postings of one run of an order. A transfer to a CashIt account
+    in `receivers` (those whose locks are held) credits that account too."""
+    kind, reference, amount = order["kind"], order["reference"], order["amount"]
+    if kind == "credit":
+        return [(acc, amount, reference, "credit", 1)]
+    if kind != "transfer":
+        return [(acc, amount, describe_payment(kind, reference), kind, -1, reference)]
+    postings = [(acc, amount, f"Transfer to {reference}", "transfer", -1)]
+    receiver_cnic = store.find_iban(reference)
+    if receiver_cnic in receivers and receiver_cnic != acc["cnic"]:
+        postings.append((store[receiver_cnic], amount, f"Transfer from {acc['name']}", "transfer", 1))
+    return postings
+
+@metrics.timed("standing_orders")
+@retry_on_conflict
+def run_standing_orders(store, runs):
+    """Execute due standing order runs, (cnic, order id, due date) in date
+    order, committing every transaction and every order's new next date in
+    a single write.
+
+    Each debit gets the same balance check as an interactive payment; a
+    run the balance does not cover is missed, and the order moves on to
+    its next date all the same, as does one for a challan already paid (an
+    order set up before challans were refused). Returns one (status,
+    transaction) pair per run, where status is "ok", "insufficient_balance",
+    "duplicate", "unknown_account" or "skipped" (the order was cancelled or
+    that run already happened)."""
+    owners = {cnic for cnic, _, _ in runs if cnic != ADMIN_CNIC and cnic in store}
+    receivers = set()
+    for cnic, order_id, _ in runs:
+        order = find_standing_order(store[cnic], order_id) if cnic in owners else None
+        if order and order["kind"] == "transfer":
+            receivers.add(store.find_iban(order["reference"]))
+    receivers.discard(None)
+
+    results = []
+    postings = []
+    headers = {}
+    saved = []   # (order, its next date before this batch)
+    paid = set()   # (kind, reference) of the challans paid in this batch
+
+    with store.locked(*owners, *receivers), store.commit_lock:
+        balances = {}
+        for cnic, order_id, due in runs:
+            if cnic not in owners:
+                results.append(("unknown_account", None))
+                continue
+            acc = store[cnic]
+            order = find_standing_order(acc, order_id)
+            if order is None or order["next"] != due:
+                results.append(("skipped", None))
+                continue
+
+            run = standing_order_postings(store, acc, order, receivers)
+            for account, *_ in run:
+                balances.setdefault(account["cnic"], account["balance"])
+            payment = (order["kind"], order["reference"])
+            if order["kind"] in REJECT_DUPLICATES and (payment in paid or store.last_payment(*payment)):
+                results.append(("duplicate", None))
+            elif order["kind"] != "credit" and balances[cnic] < order["amount"]:
+                results.append(("insufficient_balance", None))
+            else:
+                paid.add(payment)
+                results.append(("ok", len(postings)))
+                for account, amount, _, _, sign, *_ in run:
+                    balances[account["cnic"]] += sign * amount
+                postings.extend(run)
+            saved.append((order, order["next"]))
+            order["next"] = next_run(order, due)
+            headers[cnic] = acc
+
+        try:
+            transactions = post_transactions(store, postings, list(headers.values())) if headers else []
+        except Exception:
+            for order, next_date in reversed(saved):
+                order["next"] = next_date
+            raise
+
+    return [(status, None if first is None else transactions[first]) for status, first in results]
+
+class StandingOrderScheduler:
+    """Keeps every standing order's next run in a heap of (date, cnic, order id).
+
+    run() pops only what is due, so a tick costs nothing when nothing is,
+    and runs every missed date of an order after downtime, in date order,
+    as one batch. Orders are read from storage once a day (and after a
+    failed batch); ones set up since are picked up at the next day's read,
+    or at once if passed to add()."""
+
+    def __init__(self, store):
+        self.store = store
+        self.heap = []
+        self.loaded_on = None
+
+    def reload(self, today):
+        self.heap = [(order["next"], cnic, order["id"]) for cnic, order in self.store.standing_orders()]
+        heapq.heapify(self.heap)
+        self.loaded_on = today
+
+    def add(self, cnic, order):
+        heapq.heappush(self.heap, (order["next"], cnic, order["id"]))
+
+    def due(self, today):
+        """Pop the orders due by `today`: [(cnic, order id, due date)], in date order"""
+        runs = []
+        queued = set()
+        while self.heap and self.heap[0][0] <= today:
+            next_date, cnic, order_id = heapq.heappop(self.heap)
+            acc = self.store[cnic] if cnic in self.store else None
+            order = find_standing_order(acc, order_id) if acc else None
+            if order is None or (cnic, order_id) in queued:
+                continue   # cancelled, deleted with its account, or queued twice
+            if order["next"] != next_date:
+                # Moved since it was queued (e.g. run by another process)
+                heapq.heappush(self.heap, (order["next"], cnic, order_id))
+                continue
+            queued.add((cnic, order_id))
+            while next_date <= today:
+                runs.append((next_date, cnic, order_id))
+                next_date = next_run(order, next_date)
+            heapq.heappush(self.heap, (next_date, cnic, order_id))
+        runs.sort()
+        return [(cnic, order_id, due) for due, cnic, order_id in runs]
+
+    def run(self, today=None):
+        """Execute everything due by `today` ("YYYY-MM-DD", default today).
+        Returns [((cnic, order id, due date), (status, transaction))]."""
+        today = today or date.today().isoformat()
+        self.store.refresh()
+        if self.loaded_on != today:
+            self.reload(today)
+        runs = self.due(today)
+        if not runs:
+            return []
+        try:
+            results = run_standing_orders(self.store, runs)
+        except Exception:
+            self.loaded_on = None   # the heap has moved past runs that never happened
+            raise
+        return list(zip(runs, results))
@@ -0,0 +1,212 @@
+"""Timing hooks, latency histograms and counters for CashIt's hot paths.
+
+Operations are timed with the @timed decorator or a `with timer(...)`
+block. While metrics are enabled (CASHIT_METRICS=1, or enable()) every
+run is recorded in a latency histogram and an outcome counter, and runs
+slower than CASHIT_SLOW_MS milliseconds are appended to CASHIT_SLOW_LOG.
+export() writes everything in the Prometheus text format. While disabled
+a hook costs one flag check.
+"""
+
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from datetime import datetime
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+enabled = os.environ.get("CASHIT_METRICS", "") not in ("", "0")
+metrics_file = os.environ.get("CASHIT_METRICS_FILE", "metrics.prom")
+slow_log = os.environ.get("CASHIT_SLOW_LOG", "slow.log")
+slow_seconds = float(os.environ.get("CASHIT_SLOW_MS", "250")) / 1000
+
+_lock = threading.Lock()
+_histograms = {}    # operation -> [bucket counts..., +Inf count, sum of seconds]
+_counters = {}      # (metric, ((label, value), ...)) -> count
+
+
+def enable(slow_ms=None):
+    global enabled, slow_seconds
+    enabled = True
+    if slow_ms is not None:
+        slow_seconds = slow_ms / 1000
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def snapshot():
+    """A copy of everything recorded so far: (histograms, counters)"""
+    with _lock:
+        return {operation: list(h) for operation, h in _histograms.items()}, dict(_counters)
+
+
+def merge(recorded):
+    """Add a snapshot() taken elsewhere (e.g. in a worker process) to ours"""
+    histograms, counters = recorded
+    with _lock:
+        for operation, histogram in histograms.items():
+            mine = _histograms.setdefault(operation, [0] * (len(BUCKETS) + 1) + [0.0])
+            for bucket, value in enumerate(histogram):
+                mine[bucket] += value
+        for key, value in counters.items():
+            _counters[key] = _counters.get(key, 0) + value
+
+# ---------------- RECORDING ----------------
+
+def count(metric, amount=1, **labels):
+    """Add to the counter cashit_<metric>_total with the given labels"""
+    if not enabled:
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(operation, seconds, outcome="ok"):
+    """Record one finished run of an operation"""
+    if not enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(operation)
+        if histogram is None:
+            histogram = _histograms[operation] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+        key = ("operations", (("operation", operation), ("outcome", outcome)))
+        _counters[key] = _counters.get(key, 0) + 1
+
+    if seconds >= slow_seconds:
+        count("slow_operations", operation=operation)
+        try:
+            with _lock, open(slow_log, "a") as f:
+                f.write(f"{datetime.now().isoformat(timespec='milliseconds')} {operation} "
+                        f"{seconds * 1000:.1f} ms {outcome}\n")
+        except OSError:
+            pass   # the slow log must never break the operation it reports on
+
+
+class Timer:
+    """Times a `with` block as one run of `operation`"""
+
+    __slots__ = ("operation", "outcome", "started")
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.outcome = "ok"
+        self.started = None
+
+    def __enter__(self):
+        if enabled:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, error, value, traceback):
+        if self.started is not None:
+            observe(self.operation, time.perf_counter() - self.started, "error" if error else self.outcome)
+        return False
+
+
+def timer(operation):
+    """`with timer("login") as t:` times the block; set t.outcome to record
+    something other than "ok". An exception is recorded as "error"."""
+    return Timer(operation)
+
+
+def timed(operation, label=None):
+    """Decorator timing every call as `operation`. With `label`, the value
+    of that argument is appended: timed("payment", "transaction_type")
+    records pay(..., transaction_type="bill") as payment_bill."""
+    def decorate(function):
+        if label:
+            parameters = inspect.signature(function).parameters
+            position = list(parameters).index(label)
+            default = parameters[label].default
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            name = operation
+            if label:
+                value = args[position] if len(args) > position else kwargs.get(label, default)
+                name = f"{operation}_{value}"
+            with Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ---------------- EXPORT ----------------
+
+def bucket_percentile(histogram, p):
+    """Upper bound (seconds) of the bucket holding the p-th percentile;
+    None if it lies above the last bound"""
+    total = sum(histogram[:-1])
+    running = 0
+    for bound, bucket in zip(BUCKETS, histogram):
+        running += bucket
+        if running * 100 >= total * p:
+            return bound
+    return None
+
+
+def summaries():
+    """{operation: (runs, mean seconds, p50, p95, p99 bucket bounds)}"""
+    histograms, _ = snapshot()
+    return {
+        operation: (
+            sum(h[:-1]), h[-1] / max(1, sum(h[:-1])),
+            bucket_percentile(h, 50), bucket_percentile(h, 95), bucket_percentile(h, 99),
+        )
+        for operation, h in sorted(histograms.items())
+    }
+
+
+def label_text(labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}" if labels else ""
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    histograms, counters = snapshot()
+    lines = [
+        "# HELP cashit_operation_seconds Time taken by CashIt operations",
+        "# TYPE cashit_operation_seconds histogram",
+    ]
+    for operation, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + ("+Inf",), histogram):
+            cumulative += bucket
+            lines.append(f'cashit_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+        lines.append(f'cashit_operation_seconds_sum{{operation="{operation}"}} {histogram[-1]:.6f}')
+        lines.append(f'cashit_operation_seconds_count{{operation="{operation}"}} {cumulative}')
+
+    for metric in sorted({metric for metric, _ in counters}):
+        lines.append(f"# TYPE cashit_{metric}_total counter")
+        for (name, labels), value in sorted(counters.items()):
+            if name == metric:
+                lines.append(f"cashit_{metric}_total{label_text(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def export(path=None):
+    """Write the metrics file (atomically, so a scraper never reads half of it).
+    Returns the path written."""
+    path = path or metrics_file
+    temp_file = path + ".tmp"
+    with open(temp_file, "w") as f:
+        f.write(render())
+    os.replace(temp_file, path)
+    return path
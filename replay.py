@@ -0,0 +1,322 @@
+"""Record console sessions and replay them, many at once, as a load test.
+
+    python replay.py record sessions.jsonl [--name NAME] [--template]
+    python replay.py replay sessions.jsonl [--sessions 1000] [--workers 4]
+                                           [--threads 8] [--seed 1] [--out results.json]
+
+record runs the normal console and appends everything typed in it to the
+transcript file as one JSON line: {"name": ..., "inputs": [...]}. With
+--template the customer's login CNIC and PIN are saved as {cnic} and
+{pin}, and a new account's CNIC and IBAN as {new_cnic} and {new_iban}.
+
+replay feeds the transcripts, in turn, to the real menus (run_menus()),
+against the store configured as usual (CASHIT_STORAGE and friends), with
+no prompts and no login pause. {cnic}/{pin} become a random customer of
+the store for each session, and {new_cnic}/{new_iban} fresh unused ones.
+Sessions are spread over --workers processes running --threads sessions
+at a time each. The report gives session and per-input latency,
+throughput, and per-flow latency (login, payment_bill, dashboard, ...)
+from the metrics hooks.
+"""
+
+import json
+import multiprocessing
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cashit
+import metrics
+import python as console
+
+LOGIN_CNIC_PROMPT = "Enter CNIC (XXXXX-XXXXXXX-X): "
+# Prompts whose answers --template replaces with a placeholder
+TEMPLATE_PROMPTS = {
+    "Enter 4-digit PIN: ": "{pin}",
+    "Enter your current PIN: ": "{pin}",
+    "\nEnter your CNIC: ": "{new_cnic}",
+    "Enter your IBAN: ": "{new_iban}",
+}
+
+OPTIONS = {
+    "name": "session",
+    "sessions": "1000",
+    "workers": "1",
+    "threads": "1",
+    "seed": "1",
+    "out": None,
+}
+
+# ---------------- RECORD ----------------
+
+class RecordingTerminal:
+    """The local console, remembering every answer typed into it"""
+
+    def __init__(self, template=False):
+        self.template = template
+        self.inputs = []
+        self.templating_login = False
+
+    def write(self, text):
+        console.CONSOLE.write(text)
+
+    def read_line(self, prompt):
+        answer = console.CONSOLE.read_line(prompt)
+        recorded = answer
+        if self.template:
+            if prompt == LOGIN_CNIC_PROMPT:
+                # The admin logs in as themselves; customers become {cnic}
+                self.templating_login = answer.strip() != cashit.ADMIN_CNIC
+                if self.templating_login:
+                    recorded = "{cnic}"
+            elif prompt in TEMPLATE_PROMPTS and (self.templating_login or "new_" in TEMPLATE_PROMPTS[prompt]):
+                recorded = TEMPLATE_PROMPTS[prompt]
+        self.inputs.append(recorded)
+        return answer
+
+def record(path, name, template):
+    terminal = RecordingTerminal(template)
+    console.bind_terminal(terminal)
+    console.open_users()
+    try:
+        console.run_menus()
+    except (SystemExit, EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        console.bind_terminal(console.CONSOLE)
+        console.USERS.close()
+
+    with open(path, "a") as f:
+        f.write(json.dumps({"name": name, "inputs": terminal.inputs}) + "\n")
+    return len(terminal.inputs)
+
+def read_transcripts(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# ---------------- REPLAY ----------------
+
+class TimedTerminal(console.ScriptedTerminal):
+    """Answers from a script, timing how long the app takes to come back
+    with the next prompt after each answer"""
+
+    def __init__(self, answers):
+        super().__init__(answers)
+        self.steps = []
+        self.answered = None
+
+    def read_line(self, prompt):
+        self.finish_step()
+        answer = super().read_line(prompt)
+        self.answered = time.perf_counter()
+        return answer
+
+    def finish_step(self):
+        if self.answered is not None:
+            self.steps.append(time.perf_counter() - self.answered)
+            self.answered = None
+
+def fill(inputs, customer, pin, fresh):
+    """The transcript's inputs with its placeholders filled in"""
+    values = {"{cnic}": customer, "{pin}": pin, "{new_cnic}": fresh[0], "{new_iban}": fresh[1]}
+    return [values.get(answer, answer) for answer in inputs]
+
+def fresh_identity(rng):
+    """A CNIC and IBAN that almost certainly nobody holds yet"""
+    digits = f"{rng.randrange(10**12):012d}"
+    return f"6{digits[:4]}-{digits[4:11]}-{digits[11]}", f"PK{rng.randrange(10**22):022d}"
+
+def run_session(inputs):
+    """Replay one session through the real menus.
+    Returns (outcome, seconds, per-input seconds)."""
+    terminal = TimedTerminal(inputs)
+    console.bind_terminal(terminal)
+    started = time.perf_counter()
+    try:
+        console.run_menus()
+    except SystemExit:
+        outcome = "completed"       # chose Exit
+    except EOFError:
+        outcome = "incomplete"      # the script ran out first
+    except Exception:
+        outcome = "error"
+    terminal.finish_step()
+    return outcome, time.perf_counter() - started, terminal.steps
+
+def run_worker(transcripts, sessions, threads, seed, worker):
+    """Replay `sessions` transcripts (in turn) with `threads` at a time against
+    this process's own view of the store. Returns the raw results."""
+    console.LOGIN_DELAY = 0
+    metrics.enable()
+    metrics.reset()
+    console.bind_terminal(console.ScriptedTerminal())   # the store's greeting goes nowhere
+    console.open_users()
+    customers = [cnic for cnic, _ in console.USERS.items() if cnic != cashit.ADMIN_CNIC]
+
+    rng = random.Random(f"{seed}-{worker}")
+    fresh = random.Random()   # new CNICs must not repeat those of earlier runs
+    plans = [
+        (transcripts[(worker + number) % len(transcripts)], rng.choice(customers), fresh_identity(fresh))
+        for number in range(sessions)
+    ]
+
+    def replay(plan):
+        transcript, customer, identity = plan
+        pin = console.USERS[customer]["pin"] if customer in console.USERS else "0000"
+        return (transcript["name"],) + run_session(fill(transcript["inputs"], customer, pin, identity))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(replay, plans))
+    elapsed = time.perf_counter() - started
+    console.USERS.close()
+
+    outcomes = {}
+    for name, outcome, _, _ in results:
+        outcomes[name, outcome] = outcomes.get((name, outcome), 0) + 1
+    return {
+        "outcomes": outcomes,
+        "sessions": [seconds for _, _, seconds, _ in results],
+        "steps": [step for _, _, _, steps in results for step in steps],
+        "metrics": metrics.snapshot(),
+        "elapsed": elapsed,
+    }
+
+def replay(transcripts, sessions, workers, threads, seed):
+    """Spread the sessions over worker processes and combine what they report"""
+    shares = [sessions // workers + (1 if worker < sessions % workers else 0) for worker in range(workers)]
+    jobs = [(transcripts, share, threads, seed, worker) for worker, share in enumerate(shares) if share]
+
+    started = time.perf_counter()
+    if len(jobs) == 1:
+        reports = [run_worker(*jobs[0])]
+    else:
+        with multiprocessing.Pool(len(jobs)) as pool:
+            reports = pool.starmap(run_worker, jobs)
+    wall = time.perf_counter() - started
+    # Throughput counts replay time only, not starting workers and loading the store
+    elapsed = max(report["elapsed"] for report in reports)
+
+    metrics.reset()
+    outcomes = {}
+    for report in reports:
+        metrics.merge(report["metrics"])
+        for (name, outcome), count in report["outcomes"].items():
+            outcomes.setdefault(name, {})
+            outcomes[name][outcome] = outcomes[name].get(outcome, 0) + count
+
+    session_times = sorted(t for report in reports for t in report["sessions"])
+    step_times = sorted(t for report in reports for t in report["steps"])
+    return {
+        "sessions": len(session_times),
+        "workers": len(jobs),
+        "threads": threads,
+        "elapsed_s": round(elapsed, 3),
+        "wall_s": round(wall, 3),
+        "sessions_per_s": round(len(session_times) / elapsed, 2),
+        "inputs_per_s": round(len(step_times) / elapsed, 2),
+        "outcomes": outcomes,
+        "session_ms": latency(session_times),
+        "input_ms": latency(step_times),
+        "flows": {
+            operation: {
+                "runs": runs,
+                "mean_ms": round(mean * 1000, 4),
+                "p50_ms": bound_ms(p50),
+                "p95_ms": bound_ms(p95),
+                "p99_ms": bound_ms(p99),
+            }
+            for operation, (runs, mean, p50, p95, p99) in metrics.summaries().items()
+        },
+    }
+
+def latency(ordered):
+    """Mean and percentiles (milliseconds) of sorted timings"""
+    if not ordered:
+        return {}
+    stats = {"mean": round(sum(ordered) / len(ordered) * 1000, 4)}
+    for p in (50, 95, 99):
+        stats[f"p{p}"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000, 4)
+    return stats
+
+def bound_ms(seconds):
+    # Histogram percentiles are bucket bounds; None is past the last one
+    return None if seconds is None else seconds * 1000
+
+def print_results(results):
+    print("\n" + "="*64)
+    print(f"   REPLAY — {results['sessions']:,} sessions, {results['workers']} worker(s) "
+          f"x {results['threads']} thread(s)")
+    print("="*64)
+    print(f"   Time taken      : {results['elapsed_s']:.3f} s")
+    print(f"   Throughput      : {results['sessions_per_s']:,.1f} sessions/sec, {results['inputs_per_s']:,.0f} inputs/sec")
+    for name, outcomes in sorted(results["outcomes"].items()):
+        counts = ", ".join(f"{count:,} {outcome}" for outcome, count in sorted(outcomes.items()))
+        print(f"   {name[:16]:<16}: {counts}")
+    for title, stats in (("Session", results["session_ms"]), ("Per input", results["input_ms"])):
+        if stats:
+            print(f"   {title:<16}: mean {stats['mean']:.3f} ms, p50 {stats['p50']:.3f}, "
+                  f"p95 {stats['p95']:.3f}, p99 {stats['p99']:.3f}")
+
+    print("-"*64)
+    print(f"   {'flow':<24}{'runs':>8}{'mean ms':>10}{'p50 ≤':>10}{'p95 ≤':>10}")
+    for operation, flow in results["flows"].items():
+        p50 = "-" if flow["p50_ms"] is None else f"{flow['p50_ms']:g}"
+        p95 = "-" if flow["p95_ms"] is None else f"{flow['p95_ms']:g}"
+        print(f"   {operation:<24}{flow['runs']:>8,}{flow['mean_ms']:>10.3f}{p50:>10}{p95:>10}")
+    print("="*64 + "\n")
+
+# ---------------- MAIN ----------------
+
+def parse_options(argv):
+    """--name value pairs (and --template) over OPTIONS; None if they are invalid"""
+    options = dict(OPTIONS, template=False)
+    while argv:
+        name = argv.pop(0)
+        if name == "--template":
+            options["template"] = True
+        elif name.startswith("--") and name[2:] in OPTIONS and argv:
+            options[name[2:]] = argv.pop(0)
+        else:
+            return None
+    try:
+        for name in ("sessions", "workers", "threads", "seed"):
+            options[name] = int(options[name])
+    except ValueError:
+        return None
+    if min(options["sessions"], options["workers"], options["threads"]) < 1:
+        return None
+    return options
+
+def main(argv):
+    options = parse_options(argv[2:]) if len(argv) >= 2 and argv[0] in ("record", "replay") else None
+    if options is None:
+        print(__doc__)
+        return 1
+    path = argv[1]
+
+    if argv[0] == "record":
+        recorded = record(path, options["name"], options["template"])
+        print(f"\n✓ Recorded {recorded} input(s) to {path}")
+        return 0
+
+    try:
+        transcripts = read_transcripts(path)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read transcripts: {e}")
+        return 1
+    if not transcripts:
+        print(f"❌ {path} holds no sessions.")
+        return 1
+
+    results = replay(transcripts, options["sessions"], options["workers"], options["threads"], options["seed"])
+    print_results(results)
+    if options["out"]:
+        with open(options["out"], "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"✓ Results written to {options['out']}\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,153 @@
+"""Admin reports computed with NumPy over a columnar copy of the ledger.
+
+Every transaction of every customer account is extracted once into flat
+arrays (account number, timestamp, type code, signed amount in paisa),
+and each report is a handful of vectorized operations over them. The
+extract is cached until the store next changes.
+
+NumPy is optional: without it the app works as before and only the
+reports screen is unavailable.
+"""
+
+import weakref
+
+import cashit
+import metrics
+import storage
+
+try:
+    import numpy as np
+except ImportError:   # reports are unavailable, everything else works
+    np = None
+
+PERCENTILES = (10, 25, 50, 75, 90, 99)
+TYPE_CODES = {kind: code for code, kind in enumerate(storage.TRANSACTION_TYPES)}
+
+# store -> (store.change_count when extracted, Ledger)
+_extracts = weakref.WeakKeyDictionary()
+
+
+class Ledger:
+    """One array element per transaction, plus per-account arrays"""
+
+    def __init__(self, cnics, names, balances, account, minute, kind, amount):
+        self.cnics = cnics          # account number -> CNIC
+        self.names = names          # account number -> name
+        self.balances = balances    # int64 paisa, per account
+        self.account = account      # int32 account number, per transaction
+        self.minute = minute        # datetime64[m]
+        self.kind = kind            # int8 index into storage.TRANSACTION_TYPES
+        self.amount = amount        # int64 paisa, negative for debits
+
+    def __len__(self):
+        return len(self.amount)
+
+
+def available():
+    return np is not None
+
+
+def iso_date(date):
+    """"Dec 02, 2025" -> "2025-12-02", which NumPy parses in bulk"""
+    return f"{date[-4:]}-{storage.MONTHS[date[:3]]}-{date[4:6]}"
+
+
+def minute_of_day(time_text):
+    """"05:44 PM" -> 1064; legacy transactions without a time count as midnight"""
+    if not time_text:
+        return 0
+    hour, minute = int(time_text[:2]) % 12, int(time_text[3:5])
+    return (hour + (12 if time_text.endswith("PM") else 0)) * 60 + minute
+
+
+def extract(store):
+    """Build the columnar Ledger from the store (one pass over all histories)"""
+    numbers = {}
+    names = []
+    balances = []
+    for cnic, acc in store.items():
+        if cnic != cashit.ADMIN_CNIC:
+            numbers[cnic] = len(names)
+            names.append(acc["name"])
+            balances.append(acc["balance"])
+
+    # Dates and times repeat across thousands of transactions, so each
+    # distinct string is converted once
+    dates, times = {}, {}
+    account, date_column, minute_column, kind, amount = [], [], [], [], []
+    for cnic, t in store.ledger():
+        number = numbers.get(cnic)
+        if number is None:
+            continue
+        account.append(number)
+        date_column.append(dates.get(t.date) or dates.setdefault(t.date, iso_date(t.date)))
+        minute = times.get(t.time)
+        if minute is None:
+            minute = times[t.time] = minute_of_day(t.time)
+        minute_column.append(minute)
+        kind.append(TYPE_CODES.get(t.type, TYPE_CODES["debit"]))
+        amount.append(t.sign * t.amount)
+
+    days = np.array(date_column, dtype="datetime64[D]")
+    return Ledger(
+        cnics=list(numbers),
+        names=names,
+        balances=np.array(balances, dtype=np.int64),
+        account=np.array(account, dtype=np.int32),
+        minute=days.astype("datetime64[m]") + np.array(minute_column, dtype="timedelta64[m]"),
+        kind=np.array(kind, dtype=np.int8),
+        amount=np.array(amount, dtype=np.int64),
+    )
+
+
+@metrics.timed("admin_reports")
+def ledger(store):
+    """The store's Ledger, extracted again only if the store changed since"""
+    cached = _extracts.get(store)
+    if cached is None or cached[0] != store.change_count:
+        change_count = store.change_count
+        cached = _extracts[store] = (change_count, extract(store))
+    return cached[1]
+
+# ---------------- REPORTS ----------------
+# Sums use bincount weights (float64), which are exact for totals below
+# 2**53 paisa.
+
+def totals_by_type(ledger):
+    """{type: (transactions, paisa debited, paisa credited)}"""
+    types = len(storage.TRANSACTION_TYPES)
+    debit = ledger.amount < 0
+    counts = np.bincount(ledger.kind, minlength=types)
+    debited = np.bincount(ledger.kind[debit], weights=-ledger.amount[debit], minlength=types)
+    credited = np.bincount(ledger.kind[~debit], weights=ledger.amount[~debit], minlength=types)
+    return {
+        kind: (int(counts[code]), int(debited[code]), int(credited[code]))
+        for code, kind in enumerate(storage.TRANSACTION_TYPES) if counts[code]
+    }
+
+
+def daily_volumes(ledger, days=14):
+    """[(date, transactions, paisa moved)] for the latest `days` days with activity"""
+    if not len(ledger):
+        return []
+    day, position = np.unique(ledger.minute.astype("datetime64[D]"), return_inverse=True)
+    counts = np.bincount(position)
+    moved = np.bincount(position, weights=np.abs(ledger.amount))
+    return [(str(day[i]), int(counts[i]), int(moved[i])) for i in range(max(0, len(day) - days), len(day))]
+
+
+def top_spenders(ledger, count=10):
+    """[(cnic, name, paisa debited)] for the accounts that spent the most"""
+    debit = ledger.amount < 0
+    spent = np.bincount(ledger.account[debit], weights=-ledger.amount[debit], minlength=len(ledger.cnics))
+    top = np.argpartition(-spent, count)[:count] if len(spent) > count else np.arange(len(spent))
+    top = top[np.argsort(-spent[top], kind="stable")]
+    return [(ledger.cnics[i], ledger.names[i], int(spent[i])) for i in top if spent[i] > 0]
+
+
+def balance_percentiles(ledger):
+    """{percentile: balance in paisa} across customer accounts"""
+    if not len(ledger.balances):
+        return {}
+    values = np.percentile(ledger.balances, PERCENTILES)
+    return {p: int(round(value)) for p, value in zip(PERCENTILES, values)}
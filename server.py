@@ -0,0 +1,169 @@
+"""Serve the CashIt menus to many terminals at once.
+
+    python server.py [host] [port]        (default 127.0.0.1 8765)
+    python server.py --unix cashit.sock
+
+Connect with `nc 127.0.0.1 8765` (or `nc -U cashit.sock`). Every connection
+gets the same login, dashboard, payment and admin screens as python.py,
+against one account store shared by all sessions.
+
+With CASHIT_METRICS=1, `kill -USR1 <pid>` writes the metrics file (see
+metrics.py).
+
+With CASHIT_BACKUP_EVERY=3600 the store is backed up every hour (see
+`python batch.py backup`), from a background thread, while sessions go on.
+
+The event loop only moves bytes. Each session's menus run in a worker
+thread, so a user sitting at a prompt or a slow save never holds up the
+other sessions; sessions touching the same account are serialized by the
+store's per-account locks.
+"""
+
+import asyncio
+import os
+import signal
+import sys
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import batch
+import metrics
+import python as console
+import storage
+
+MAX_SESSIONS = 256
+IDLE_TIMEOUT = 600   # seconds a session may wait at a prompt before it is closed
+BACKUP_EVERY = float(os.environ.get("CASHIT_BACKUP_EVERY", "0"))   # seconds between backups; 0 for none
+
+active_sessions = 0
+USAGE = "Usage: python server.py [host] [port] | --unix PATH"
+
+
+class SocketTerminal:
+    """say()/ask() for one connection, called from the session's worker thread"""
+
+    def __init__(self, loop, reader, writer):
+        self.loop = loop
+        self.reader = reader
+        self.writer = writer
+
+    def write(self, text):
+        if self.loop.is_closed():
+            raise EOFError("server shutting down")
+        self.loop.call_soon_threadsafe(self.writer.write, text.encode())
+
+    def read_line(self, prompt):
+        self.write(prompt)
+        line = asyncio.run_coroutine_threadsafe(self.next_line(), self.loop).result()
+        if not line:
+            raise EOFError("client disconnected")
+        return line.decode(errors="replace").rstrip("\r\n")
+
+    async def next_line(self):
+        await self.writer.drain()
+        return await asyncio.wait_for(self.reader.readline(), IDLE_TIMEOUT)
+
+
+def run_session(terminal):
+    console.bind_terminal(terminal)
+    try:
+        console.run_menus()
+    except (SystemExit, EOFError, TimeoutError, CancelledError, OSError):
+        pass   # chose Exit, hung up, went idle or the server is stopping
+
+
+async def handle_connection(reader, writer, executor):
+    global active_sessions
+    loop = asyncio.get_running_loop()
+
+    try:
+        if active_sessions >= MAX_SESSIONS:
+            writer.write("❌ Too many sessions, please try again later.\n".encode())
+            await writer.drain()
+            return
+
+        active_sessions += 1
+        try:
+            await loop.run_in_executor(executor, run_session, SocketTerminal(loop, reader, writer))
+        finally:
+            active_sessions -= 1
+    except asyncio.CancelledError:
+        pass   # server shutting down; the worker ends at its next prompt
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+def write_metrics():
+    try:
+        console.say(f"✓ Metrics written to {metrics.export()}")
+    except OSError as e:
+        console.say(f"❌ Could not write metrics: {e}")
+
+
+async def run_backups(every):
+    """Back the store up every `every` seconds, one backup at a time"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(every)
+        path = batch.default_backup_path()
+        try:
+            thread = await loop.run_in_executor(None, storage.start_backup, console.USERS, path)
+            await loop.run_in_executor(None, thread.join)
+        except Exception as e:
+            console.say(f"❌ Backup failed: {e}")
+            continue
+        if thread.error:
+            console.say(f"❌ Backup failed: {thread.error}")
+        else:
+            console.say(f"✓ Backed up {thread.result[0]:,} account(s) to {path}")
+
+
+async def serve(host="127.0.0.1", port=8765, unix_path=None):
+    console.open_users()
+    executor = ThreadPoolExecutor(MAX_SESSIONS, thread_name_prefix="session")
+    if metrics.enabled and hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, write_metrics)
+
+    def on_connect(reader, writer):
+        return handle_connection(reader, writer, executor)
+
+    if unix_path:
+        server = await asyncio.start_unix_server(on_connect, unix_path)
+        console.say(f"✓ CashIt server listening on {unix_path}")
+    else:
+        server = await asyncio.start_server(on_connect, host, port)
+        console.say(f"✓ CashIt server listening on {host}:{port}")
+
+    backups = asyncio.create_task(run_backups(BACKUP_EVERY)) if BACKUP_EVERY > 0 else None
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if backups:
+            backups.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+        console.USERS.close()
+
+
+def main(argv):
+    if argv[:1] == ["--unix"] and len(argv) == 2:
+        options = {"unix_path": argv[1]}
+    elif len(argv) <= 2 and "--unix" not in argv and all(p.isdigit() for p in argv[1:]):
+        options = dict(zip(("host", "port"), argv))
+        options["port"] = int(options.get("port", 8765))
+    else:
+        console.say(USAGE)
+        return 1
+
+    try:
+        asyncio.run(serve(**options))
+    except KeyboardInterrupt:
+        console.say("\nServer stopped.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
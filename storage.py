@@ -0,0 +1,2620 @@
+import bisect
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+# ---------------- STORAGE BACKENDS ----------------
+#
+# Every backend behaves like a read-only dict of account headers keyed by
+# CNIC (`cnic in store`, `store[cnic]`, `store.items()`), and persists
+# changes through explicit calls:
+#
+#   put_account(acc)            new account or changed header fields
+#   add_transaction(acc, txn)   new transaction plus the balance it left
+#   add_transactions(entries, headers)
+#                               several (acc, txn) pairs committed atomically, with
+#                               the other header fields of the accounts in `headers`
+#   delete_account(cnic)
+#   import_accounts(entries)    many (acc, transactions) pairs in one write
+#   archive_history(before)     move transactions of months before `before` to the archive
+#   save_all()                  full snapshot / checkpoint
+#
+# view() returns a read-only copy of the store as it is at that moment
+# (see BACKUPS), which commits made afterwards do not change.
+#
+# An account header carries only the last few transactions ("recent");
+# the full history is read on demand with history(cnic), and includes
+# anything moved to the compressed per-month archive (HistoryArchive). Headers returned
+# by a backend are live: the app mutates them in place and then calls the
+# matching persist method.
+#
+# Backends are shared by every session thread (see server.py). A writer
+# holds `commit_lock` from the moment it changes a live header until the
+# change is persisted, so a snapshot never captures half of a change or a
+# change its own journal record then repeats. Backends take it themselves
+# in every persist method; it is re-entrant.
+#
+# Several processes may also share one data directory. Every account
+# header carries a `version` that each committed change increases. Before
+# committing, a backend catches up with what other processes committed
+# and raises VersionConflict (writing nothing) if one of the accounts it
+# is about to write changed underneath it; the caller undoes its
+# in-memory change, calls refresh() and tries again.
+#
+# Money is stored as integer paisa (Rs 1 = 100 paisa). Transactions are
+# Transaction tuples with a positive amount and a sign of +1 (credit) or
+# -1 (debit), saved as JSON arrays; data written in any older shape is
+# converted when it is read.
+#
+# Bill, tax and challan payments also carry their reference (bill ID, tax
+# reference, challan number). find_payments(kind, reference) answers from
+# an index of the live store (archived months are not searched), and
+# last_payment() from a bounded cache of recent lookups and commits in
+# front of it.
+#
+# Headers also keep running spending totals, {"YYYY-MM": {type: paisa}},
+# updated with each debit, so nothing has to rescan a history to know
+# what an account spent. monthly_spending is the total of the month of
+# the latest debit.
+#
+# A header may hold standing orders, "standing_orders": a list of
+# {"id", "kind", "reference", "amount", "every", "day", "next"} dicts (see
+# cashit.py), persisted with the rest of the header.
+
+ACCOUNT_FIELDS = ("name", "cnic", "iban", "pin", "balance", "savings", "monthly_spending", "version")
+MONEY_FIELDS = ("balance", "savings", "monthly_spending")
+RECENT_TRANSACTIONS = 5   # kept inline with the header for the dashboard
+RECENT_PAYMENTS = 10000   # (kind, reference) pairs whose last payment last_payment() keeps in memory
+STANDING_ORDER_FIELDS = ("id", "kind", "reference", "amount", "every", "day", "next")
+
+
+class VersionConflict(Exception):
+    """Another process committed a change to an account being written"""
+
+
+class AccountGone(Exception):
+    """The account being written was deleted, here or by another process.
+    Unlike a VersionConflict, trying again cannot help."""
+
+
+def lock_file(f, shared=False):
+    """Block until this process holds the exclusive (or a shared) OS lock on
+    an open file. Windows only has exclusive locks."""
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def unlock_file(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def release_views_lock(f):
+    unlock_file(f)
+    f.close()
+
+
+def write_atomic(path, data):
+    """Write a file under a temporary name and rename it into place, so it
+    is never seen half-written"""
+    temp_file = path + ".tmp"
+    with open(temp_file, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+def pin_file(path, length=None):
+    """A file object that keeps `path`'s current contents (its first `length`
+    bytes) while it is open, for a file that is only ever appended to or
+    replaced by rename. Windows cannot replace an open file, so there the
+    contents are read instead."""
+    f = open(path, "rb")
+    if fcntl:
+        return f
+    with f:
+        return io.BytesIO(f.read() if length is None else f.read(length))
+
+
+def iban_key(iban):
+    """IBANs are indexed without spaces and in upper case"""
+    return iban.replace(" ", "").upper()
+
+
+def name_key(name):
+    """Names are searched without case or surrounding spaces"""
+    return name.strip().lower()
+
+
+def is_cnic_search(text):
+    """Searches made only of digits and dashes (or empty) go by CNIC, the rest by name"""
+    return all(char.isdigit() or char == "-" for char in text)
+
+
+class PrefixIndex:
+    """Sorted (key, cnic) pairs: a prefix is a contiguous range found by
+    bisection, and a substring search scans keys only. Kept up to date
+    with set()/discard() as accounts change."""
+
+    def __init__(self, keys):
+        self.keys = dict(keys)   # cnic -> key
+        self.entries = sorted((key, cnic) for cnic, key in self.keys.items())
+
+    def set(self, cnic, key):
+        if self.keys.get(cnic) == key:
+            return
+        self.discard(cnic)
+        self.keys[cnic] = key
+        bisect.insort(self.entries, (key, cnic))
+
+    def discard(self, cnic):
+        key = self.keys.pop(cnic, None)
+        if key is not None:
+            del self.entries[bisect.bisect_left(self.entries, (key, cnic))]
+
+    CHUNK = 256
+
+    def walk(self, start):
+        """Yield entries after `start` in order. The position is found again
+        by bisection for every chunk, so accounts added or removed meanwhile
+        cannot make the walk skip or repeat entries."""
+        while True:
+            position = bisect.bisect_right(self.entries, start)
+            chunk = self.entries[position:position + self.CHUNK]
+            yield from chunk
+            if len(chunk) < self.CHUNK:
+                return
+            start = chunk[-1]
+
+    def prefix(self, prefix):
+        """Lazily yield CNICs whose key starts with `prefix`, in key order"""
+        for key, cnic in self.walk((prefix,)):
+            if not key.startswith(prefix):
+                return
+            yield cnic
+
+    def containing(self, text):
+        """Lazily yield CNICs whose key contains `text`, in key order"""
+        for key, cnic in self.walk(()):
+            if text in key:
+                yield cnic
+
+
+def to_paisa(rupees):
+    """Convert a rupee amount (float, int or numeric string such as "-1,500.00") to integer paisa"""
+    value = Decimal(str(rupees).replace("Rs", "").replace(",", "").strip())
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+TRANSACTION_FIELDS = ("description", "date", "time", "amount", "sign", "type", "balance_after", "reference")
+TRANSACTION_TYPES = ("transfer", "bill", "tax", "challan", "admin", "debit", "credit")
+
+# Transactions written before references were kept have no last field
+class Transaction(namedtuple("Transaction", TRANSACTION_FIELDS, defaults=(None,))):
+    __slots__ = ()   # tuple-backed, so a transaction costs no per-instance dict
+
+    @property
+    def timestamp(self):
+        """Date and time as "YYYY-MM-DD HH:MM", which sorts in time order"""
+        return sortable_time(self.date, self.time)
+
+
+def make_transaction(description, date, time_text, amount, sign, kind, balance_after, reference=None):
+    # Type codes are interned so millions of transactions share a handful of strings
+    kind = kind or ("credit" if sign > 0 else "debit")
+    return Transaction(description, date, time_text, amount, sign, sys.intern(kind), balance_after, reference)
+
+
+def is_current_transaction(t):
+    return isinstance(t, (tuple, list)) and len(t) in (len(TRANSACTION_FIELDS) - 1, len(TRANSACTION_FIELDS))
+
+
+def upgrade_transaction(t):
+    """Bring a transaction in any shape (current, older or legacy) up to a Transaction.
+
+    The oldest entries are (description, date, "-1500") tuples; later ones
+    are dicts whose amount is a display string like "-1,500.00" or, after
+    that, paisa with a separate "sign". An amount without a "+" was always
+    shown as a debit. Legacy entries have no time, type or balance_after;
+    their type becomes "credit" or "debit"."""
+    if isinstance(t, Transaction):
+        return t
+    if is_current_transaction(t):
+        return make_transaction(*t)
+
+    if isinstance(t, (tuple, list)):
+        t = {"description": t[0], "date": t[1], "amount": t[2]}
+
+    if "sign" in t:
+        amount = t["amount"]
+        sign = t["sign"]
+        balance_after = t.get("balance_after")
+    else:
+        amount = abs(to_paisa(t["amount"]))
+        sign = 1 if "+" in str(t["amount"]) else -1
+        balance_after = t.get("balance_after")
+        if balance_after is not None:
+            balance_after = to_paisa(balance_after)
+
+    return make_transaction(t["description"], t["date"], t.get("time"), amount, sign, t.get("type"), balance_after)
+
+
+def split_history(acc):
+    """Move an inline `transactions` list out of an account dict.
+    Returns the full list; the header keeps only the most recent tail."""
+    transactions = [upgrade_transaction(t) for t in acc.pop("transactions", [])]
+    acc["recent"] = transactions[-RECENT_TRANSACTIONS:]
+    return transactions
+
+
+def push_recent(acc, transaction):
+    acc["recent"].append(transaction)
+    del acc["recent"][:-RECENT_TRANSACTIONS]
+
+
+MONTHS = {name: f"{number:02d}" for number, name in enumerate(
+    ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), start=1)}
+
+
+def month_key(date):
+    """"Dec 02, 2025" -> "2025-12", without a strptime() per transaction"""
+    return f"{date[-4:]}-{MONTHS[date[:3]]}"
+
+
+def sortable_day(date):
+    """"Dec 02, 2025" -> "2025-12-02" """
+    return f"{date[-4:]}-{MONTHS[date[:3]]}-{date[4:6]}"
+
+
+def sortable_clock(time_text):
+    """"05:44 PM" -> "17:44"; legacy transactions without a time count as midnight"""
+    if not time_text:
+        return "00:00"
+    hour = int(time_text[:2]) % 12 + (12 if time_text.endswith("PM") else 0)
+    return f"{hour:02d}:{time_text[3:5]}"
+
+
+def sortable_time(date, time_text):
+    """"Dec 02, 2025", "05:44 PM" -> "2025-12-02 17:44" """
+    return f"{sortable_day(date)} {sortable_clock(time_text)}"
+
+
+def add_spending(acc, transaction, direction=1):
+    """Fold a debit into the account's spending per month and type;
+    direction=-1 takes it back out"""
+    if transaction.sign > 0:
+        return
+    totals = acc.setdefault("spending", {}).setdefault(month_key(transaction.date), {})
+    totals[transaction.type] = totals.get(transaction.type, 0) + direction * transaction.amount
+    acc["monthly_spending"] = sum(totals.values())
+
+
+class StorageBackend:
+    replayed = 0   # journal records re-applied by load(), for backends that keep one
+
+    def __init__(self):
+        self.account_locks = {}
+        self.account_locks_guard = threading.Lock()
+        self.commit_lock = threading.RLock()
+        # Goes up with every commit, ours or (once refreshed) another process's;
+        # anything derived from the data can be cached against it
+        self.change_count = 0
+        self.payment_cache = OrderedDict()   # (kind, reference) -> (cnic, transaction) or None
+
+    def load(self, defaults):
+        """Open the store, seeding it with `defaults` if it is empty.
+        Returns "loaded", "new" or "corrupted"."""
+        raise NotImplementedError
+
+    def __contains__(self, cnic):
+        raise NotImplementedError
+
+    def __getitem__(self, cnic):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def items(self):
+        """Yield (cnic, account header) pairs"""
+        raise NotImplementedError
+
+    def history(self, cnic):
+        """Every transaction of an account, oldest first"""
+        raise NotImplementedError
+
+    def find_iban(self, iban):
+        """CNIC of the account holding `iban`, or None"""
+        raise NotImplementedError
+
+    def headers(self, cnics):
+        """{cnic: account header} for those of `cnics` that exist, read together"""
+        return {cnic: self[cnic] for cnic in cnics if cnic in self}
+
+    def existing(self, cnics):
+        """The set of those of `cnics` that have an account"""
+        return {cnic for cnic in cnics if cnic in self}
+
+    def find_ibans(self, ibans):
+        """{iban: CNIC} for those of `ibans` an account holds"""
+        found = {}
+        for iban in ibans:
+            cnic = self.find_iban(iban)
+            if cnic is not None:
+                found[iban] = cnic
+        return found
+
+    def ledger(self):
+        """Yield (cnic, transaction) for every transaction of every account"""
+        for cnic, _ in self.items():
+            for transaction in self.history(cnic):
+                yield cnic, transaction
+
+    def transactions_between(self, cnic, start, end):
+        """Lazily yield an account's transactions whose timestamp lies from
+        `start` to `end` ("YYYY-MM-DD HH:MM", both included), oldest first"""
+        for transaction in self.history(cnic):
+            if start <= transaction.timestamp <= end:
+                yield transaction
+
+    def find_payments(self, kind, reference):
+        """Every (cnic, transaction) paying `reference` as a `kind` payment, oldest first"""
+        payments = [
+            (cnic, t) for cnic, t in self.ledger()
+            if t.reference == reference and t.type == kind
+        ]
+        payments.sort(key=lambda payment: payment[1].timestamp)
+        return payments
+
+    def last_payment(self, kind, reference):
+        """The latest (cnic, transaction) paying `reference`, or None"""
+        key = (kind, reference)
+        with self.commit_lock:
+            if key in self.payment_cache:
+                self.payment_cache.move_to_end(key)
+                return self.payment_cache[key]
+            payments = self.find_payments(kind, reference)
+            payment = payments[-1] if payments else None
+            self.remember_payment(key, payment)
+        return payment
+
+    def remember_payment(self, key, payment):
+        self.payment_cache[key] = payment
+        self.payment_cache.move_to_end(key)
+        if len(self.payment_cache) > RECENT_PAYMENTS:
+            self.payment_cache.popitem(last=False)
+
+    def note_payments(self, entries):
+        """Keep the payments among newly committed (cnic, transaction) pairs in the cache"""
+        for cnic, t in entries:
+            if t.reference is not None:
+                self.remember_payment((t.type, t.reference), (cnic, t))
+
+    def search(self, text, anywhere=False):
+        """Yield (cnic, account header) for accounts whose CNIC (for a text
+        of digits and dashes) or name starts with `text`, or contains it
+        if `anywhere`, sorted by that field. Results are read lazily."""
+        raise NotImplementedError
+
+    def standing_orders(self):
+        """Yield (cnic, standing order) for every standing order of every account"""
+        for cnic, acc in self.items():
+            for order in acc.get("standing_orders", ()):
+                yield cnic, order
+
+    def put_account(self, acc):
+        raise NotImplementedError
+
+    def add_transaction(self, acc, transaction):
+        raise NotImplementedError
+
+    def add_transactions(self, entries, headers=()):
+        raise NotImplementedError
+
+    def delete_account(self, cnic):
+        raise NotImplementedError
+
+    def import_accounts(self, entries):
+        raise NotImplementedError
+
+    def archive_history(self, before):
+        """Move the transactions of months before `before` ("YYYY-MM") into
+        the archive. Returns how many were moved."""
+        raise NotImplementedError
+
+    def save_all(self):
+        pass
+
+    def view(self):
+        """A read-only backend of the same kind holding the store as it is
+        now; commits made afterwards, here or in other processes, do not show
+        in it. Taking one is quick and blocks no writer. close() it when done."""
+        raise NotImplementedError
+
+    def hold_views_lock(self):
+        """The views lock file, locked shared, for a view to hold while it is open"""
+        f = open(self.views_lock_path, "a+b")
+        try:
+            lock_file(f, shared=True)
+        except Exception:
+            f.close()
+            raise
+        return f
+
+    @contextmanager
+    def views_excluded(self):
+        """Wait until no view of the store is open, in any process, and keep
+        new ones from opening meanwhile. Taken, before any other lock, by the
+        few operations that rewrite or remove history in place."""
+        with open(self.views_lock_path, "a+b") as f:
+            lock_file(f)
+            try:
+                yield
+            finally:
+                unlock_file(f)
+
+    def refresh(self):
+        """Pick up changes committed by other processes sharing the data"""
+        pass
+
+    def close(self):
+        pass
+
+    @contextmanager
+    def locked(self, *cnics):
+        """Hold the locks of every account in `cnics`.
+
+        Locks are always taken in sorted CNIC order, so two transfers
+        between the same pair of accounts cannot deadlock."""
+        with self.account_locks_guard:
+            locks = [self.account_locks.setdefault(cnic, threading.Lock()) for cnic in sorted(set(cnics))]
+
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+
+# ---------------- HISTORY ARCHIVE ----------------
+
+class HistoryArchive:
+    """Transactions moved out of the live store, one compressed segment per month.
+
+    archive/YYYY-MM.gz holds one gzip member per account (and per archiving
+    run that added to it), and archive/YYYY-MM.json indexes them as
+    {cnic: [[offset, length], ...]}. Segments are only appended to; an
+    index is replaced atomically once the members it lists are on disk,
+    so it is what commits them.
+
+    A month is archived for an account all at once, and only after its
+    index is written are the transactions removed from the live store. A
+    reader that finds a month in the archive therefore ignores any live
+    transactions of that month: they were left behind by an interrupted
+    run."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.indexes = {}      # month -> ((mtime, size) of the index file when read, index)
+        self.references = {}   # month -> (index it was built from, {(kind, reference): [(cnic, transaction)]})
+
+    def segment_file(self, month):
+        return os.path.join(self.directory, f"{month}.gz")
+
+    def index_file(self, month):
+        return os.path.join(self.directory, f"{month}.json")
+
+    def months(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def index(self, month):
+        """A month's index; read again only when another process has rewritten it"""
+        try:
+            stat = os.stat(self.index_file(month))
+        except FileNotFoundError:
+            return {}
+        cached = self.indexes.get(month)
+        if cached is None or cached[0] != (stat.st_mtime_ns, stat.st_size):
+            with open(self.index_file(month), "r") as f:
+                cached = self.indexes[month] = ((stat.st_mtime_ns, stat.st_size), json.load(f))
+        return cached[1]
+
+    def write_index(self, month, index):
+        write_atomic(self.index_file(month), json.dumps(index, separators=(",", ":")))
+
+    def read_members(self, f, members):
+        transactions = []
+        for offset, length in members:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+            transactions += [make_transaction(*json.loads(line)) for line in data.splitlines()]
+        return transactions
+
+    def history(self, cnic, first="0000-00", last="9999-99"):
+        """(archived transactions of an account, oldest first; the months they
+        cover), from the months `first` to `last` only if given"""
+        transactions, months = [], set()
+        for month in self.months():
+            if not first <= month <= last:
+                continue
+            members = self.index(month).get(cnic)
+            if members:
+                months.add(month)
+                with open(self.segment_file(month), "rb") as f:
+                    transactions += self.read_members(f, members)
+        return transactions, months
+
+    def month_references(self, month):
+        """A month's payments by (kind, reference); built again only when its index changes"""
+        index = self.index(month)
+        cached = self.references.get(month)
+        if cached is None or cached[0] is not index:
+            payments = {}
+            if index:
+                with open(self.segment_file(month), "rb") as f:
+                    for cnic, members in index.items():
+                        for t in self.read_members(f, members):
+                            if t.reference is not None:
+                                payments.setdefault((t.type, t.reference), []).append((cnic, t))
+            cached = self.references[month] = (index, payments)
+        return cached[1]
+
+    def payments(self):
+        """Yield ((kind, reference), [(cnic, transaction), ...]) for every archived payment"""
+        for month in self.months():
+            yield from self.month_references(month).items()
+
+    def find_payments(self, kind, reference):
+        """Every archived (cnic, transaction) paying `reference` as a `kind` payment"""
+        payments = []
+        for month in self.months():
+            payments += self.month_references(month).get((kind, reference), ())
+        return payments
+
+    def months_by_account(self):
+        """{cnic: set of archived months}"""
+        months = {}
+        for month in self.months():
+            for cnic in self.index(month):
+                months.setdefault(cnic, set()).add(month)
+        return months
+
+    def entries(self):
+        """Yield (month, cnic, transactions) for everything archived, one segment at a time"""
+        for month in self.months():
+            index = self.index(month)
+            with open(self.segment_file(month), "rb") as f:
+                for cnic, members in index.items():
+                    yield month, cnic, self.read_members(f, members)
+
+    def add(self, month, histories):
+        """Append {cnic: transactions} to a month's segment and commit them in its index"""
+        os.makedirs(self.directory, exist_ok=True)
+        index = {cnic: list(members) for cnic, members in self.index(month).items()}
+        with open(self.segment_file(month), "ab") as f:
+            # Anything past the last indexed member is from an interrupted run
+            f.truncate(max((offset + length for members in index.values() for offset, length in members), default=0))
+            for cnic, transactions in histories.items():
+                data = gzip.compress(b"".join(json.dumps(t).encode() + b"\n" for t in transactions), mtime=0)
+                index.setdefault(cnic, []).append([f.tell(), len(data)])
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.write_index(month, index)
+
+    def forget(self, cnic):
+        """Drop a deleted account from the indexes (its bytes stay in the segments)"""
+        for month in self.months():
+            index = self.index(month)
+            if cnic in index:
+                self.write_index(month, {other: members for other, members in index.items() if other != cnic})
+
+
+def without_archived(transactions, months):
+    """Live transactions minus those of months already in the archive"""
+    if not months:
+        return transactions
+    return [t for t in transactions if month_key(t.date) not in months]
+
+
+# ---------------- BINARY SNAPSHOT ----------------
+#
+# users.snap, the compact alternative to users.json (CASHIT_SNAPSHOT=binary):
+#
+#   header   magic, generation, number of accounts, offset of the index
+#   records  one per account: u32 length, then balance, savings,
+#            monthly_spending and version as int64, name, cnic, iban and
+#            pin as u16-length-prefixed UTF-8 (0xFFFF for None), and the
+#            remaining fields (recent, spending) as compact JSON
+#   index    the CNICs and IBAN keys as newline-separated text, then the
+#            record offsets and history_bytes as uint64 arrays
+#
+# Loading reads the header and the index only; the file is memory-mapped
+# and each account header is decoded the first time it is used. All
+# integers are little-endian.
+
+SNAPSHOT_FORMATS = ("json", "binary")
+SNAPSHOT_MAGIC = b"CASHSNP1"
+SNAPSHOT_HEADER = struct.Struct("<8sQQQ")
+RECORD_LENGTH = struct.Struct("<I")
+RECORD_NUMBERS = struct.Struct("<qqqq")
+TEXT_LENGTH = struct.Struct("<H")
+INDEX_LENGTH = struct.Struct("<Q")
+NO_TEXT = 0xFFFF
+NUMBER_FIELDS = ("balance", "savings", "monthly_spending", "version")
+TEXT_FIELDS = ("name", "cnic", "iban", "pin")
+
+
+def encode_header(acc):
+    """One account header as a length-prefixed snapshot record"""
+    parts = [RECORD_NUMBERS.pack(*(acc.get(field, 0) for field in NUMBER_FIELDS))]
+    for field in TEXT_FIELDS:
+        value = acc.get(field)
+        if value is None:
+            parts.append(TEXT_LENGTH.pack(NO_TEXT))
+        else:
+            data = value.encode()
+            parts += [TEXT_LENGTH.pack(len(data)), data]
+    rest = {key: value for key, value in acc.items() if key not in NUMBER_FIELDS and key not in TEXT_FIELDS}
+    parts.append(json.dumps(rest, separators=(",", ":")).encode())
+    body = b"".join(parts)
+    return RECORD_LENGTH.pack(len(body)) + body
+
+
+def decode_header(buffer, offset):
+    """The account header whose record starts at `offset`"""
+    length, = RECORD_LENGTH.unpack_from(buffer, offset)
+    position = offset + RECORD_LENGTH.size
+    end = position + length
+    numbers = RECORD_NUMBERS.unpack_from(buffer, position)
+    position += RECORD_NUMBERS.size
+
+    acc = {}
+    for field in TEXT_FIELDS:
+        size, = TEXT_LENGTH.unpack_from(buffer, position)
+        position += TEXT_LENGTH.size
+        if size == NO_TEXT:
+            acc[field] = None
+        else:
+            acc[field] = str(buffer[position:position + size], "utf-8")
+            position += size
+    acc.update(zip(NUMBER_FIELDS, numbers))
+    acc.update(json.loads(buffer[position:end]))
+    acc["recent"] = [make_transaction(*t) for t in acc["recent"]]   # always in the current shape
+    return acc
+
+
+class SnapshotHeaders(MutableMapping):
+    """The account headers of a binary snapshot, used like the dict
+    JsonBackend otherwise keeps them in. Each is decoded from the mapped
+    file the first time it is read, and is live from then on."""
+
+    def __init__(self, buffer, offsets):
+        self.buffer = buffer
+        self.offsets = offsets    # cnic -> record offset, until decoded
+        self.decoded = {}         # cnic -> live header
+        self.lock = threading.Lock()
+
+    def __getitem__(self, cnic):
+        acc = self.decoded.get(cnic)
+        if acc is None:
+            with self.lock:
+                acc = self.decoded.get(cnic)
+                if acc is None:
+                    acc = self.decoded[cnic] = decode_header(self.buffer, self.offsets[cnic])
+                    del self.offsets[cnic]
+        return acc
+
+    def __setitem__(self, cnic, acc):
+        with self.lock:
+            self.decoded[cnic] = acc
+            self.offsets.pop(cnic, None)
+
+    def __delitem__(self, cnic):
+        with self.lock:
+            found = self.decoded.pop(cnic, None) is not None
+            if self.offsets.pop(cnic, None) is None and not found:
+                raise KeyError(cnic)
+
+    # A header moves from `offsets` to `decoded` (added there first), so
+    # looking in `offsets` first never misses one that is being decoded
+    def __contains__(self, cnic):
+        return cnic in self.offsets or cnic in self.decoded
+
+    def __iter__(self):
+        return iter(dict.fromkeys(list(self.offsets) + list(self.decoded)))
+
+    def __len__(self):
+        return len(self.offsets) + len(self.decoded)
+
+    def raw_record(self, cnic):
+        """The record of a header not decoded yet (so unchanged since the
+        snapshot was written), or None"""
+        offset = self.offsets.get(cnic)
+        if offset is None:
+            return None
+        length, = RECORD_LENGTH.unpack_from(self.buffer, offset)
+        return self.buffer[offset:offset + RECORD_LENGTH.size + length]
+
+
+def uint64_column(values):
+    column = array("Q", values)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column.tobytes()
+
+
+def encode_snapshot(generation, history_bytes, users, iban_index):
+    """A whole binary snapshot. Records of headers nobody has read since
+    the last snapshot are copied over as they are."""
+    raw_record = users.raw_record if isinstance(users, SnapshotHeaders) else lambda cnic: None
+    ibans = {cnic: key for key, cnic in iban_index.items()}
+    records, cnics, iban_keys, offsets = [], [], [], []
+    position = SNAPSHOT_HEADER.size
+
+    for cnic in list(users):
+        record = raw_record(cnic)
+        if record is None:
+            acc = users[cnic]
+            record = encode_header(acc)
+            iban = iban_key(acc["iban"]) if acc.get("iban") else ""
+        else:
+            iban = ibans.get(cnic, "")
+        records.append(record)
+        cnics.append(cnic)
+        iban_keys.append(iban)
+        offsets.append(position)
+        position += len(record)
+
+    index = []
+    for column in (cnics, iban_keys):
+        text = "\n".join(column).encode()
+        index += [INDEX_LENGTH.pack(len(text)), text]
+    index.append(uint64_column(offsets))
+    index.append(uint64_column(history_bytes.get(cnic, 0) for cnic in cnics))
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(cnics), position)
+    return b"".join([header] + records + index)
+
+
+def read_snapshot_file(path):
+    """Map a binary snapshot and read its index.
+    Returns (generation, history_bytes, SnapshotHeaders, iban_index)."""
+    with open(path, "rb") as f:
+        return read_snapshot(f, path)
+
+
+def read_snapshot(f, path):
+    """read_snapshot_file() of an open file (`path` names it in errors)"""
+    # Windows cannot replace a file that is mapped, so there it is read instead
+    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if fcntl else f.read()
+    magic, generation, count, position = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not a CashIt snapshot")
+
+    columns = []
+    for _ in range(2):
+        size, = INDEX_LENGTH.unpack_from(buffer, position)
+        position += INDEX_LENGTH.size
+        columns.append(str(buffer[position:position + size], "utf-8").split("\n") if count else [])
+        position += size
+    for _ in range(2):
+        column = array("Q")
+        column.frombytes(buffer[position:position + column.itemsize * count])
+        if sys.byteorder == "big":
+            column.byteswap()
+        columns.append(column)
+        position += column.itemsize * count
+    cnics, iban_keys, offsets, sizes = columns
+    if not len(cnics) == len(iban_keys) == len(offsets) == len(sizes) == count:
+        raise ValueError(f"{path} is truncated")
+
+    history_bytes = {cnic: size for cnic, size in zip(cnics, sizes) if size}
+    iban_index = {key: cnic for cnic, key in zip(cnics, iban_keys) if key}
+    return generation, history_bytes, SnapshotHeaders(buffer, dict(zip(cnics, offsets))), iban_index
+
+
+# ---------------- JSON FILE + JOURNAL ----------------
+
+# Date and time at the start of a history line as json.dumps() writes a
+# Transaction, so indexing a file needs no full parse of each line
+HISTORY_LINE_TIME = re.compile(rb'\["[^"\\]*(?:\\.[^"\\]*)*", "([A-Z][a-z]{2} \d{2}, \d{4})", (?:"(\d{2}:\d{2} [AP]M)"|null), ')
+
+
+def encode_json_snapshot(generation, history_bytes, users):
+    """users.json text with one account per line. It is written by json's C
+    encoder, which an indent= dump never uses, and still reads and diffs
+    well."""
+    accounts = ",\n".join(f"        {json.dumps(cnic)}: {json.dumps(acc)}" for cnic, acc in users.items())
+    return (
+        "{\n"
+        f'    "generation": {generation},\n'
+        '    "units": "paisa",\n'
+        f'    "history_bytes": {json.dumps(history_bytes)},\n'
+        '    "accounts": {\n' + accounts + "\n    }\n}\n"
+    )
+
+
+def load_json_snapshot(f):
+    """Read a users.json in the current layout from an open file.
+    Returns (generation, history_bytes, accounts, iban_index)."""
+    snapshot = json.load(f)
+    generation, history_bytes, accounts = snapshot["generation"], snapshot["history_bytes"], snapshot["accounts"]
+    for data in accounts.values():
+        data["recent"] = [upgrade_transaction(t) for t in data["recent"]]
+        data.setdefault("version", 0)
+        data.setdefault("spending", {})
+    iban_index = {iban_key(u["iban"]): cnic for cnic, u in accounts.items() if u.get("iban")}
+    return generation, history_bytes, accounts, iban_index
+
+
+def line_timestamp(line, days, clocks):
+    """The timestamp of a history line. `days` and `clocks` keep the
+    converted date and time strings, which repeat from line to line."""
+    match = HISTORY_LINE_TIME.match(line)
+    if match is None:   # an older shape of transaction
+        return upgrade_transaction(json.loads(line)).timestamp
+    date, time_text = match.groups()
+    day = days.get(date)
+    if day is None:
+        day = days[date] = sortable_day(date.decode())
+    clock = clocks.get(time_text)
+    if clock is None:
+        clock = clocks[time_text] = sortable_clock(time_text and time_text.decode())
+    return f"{day} {clock}"
+
+
+class JsonBackend(StorageBackend):
+    """Account headers in memory, a users.json snapshot plus an append-only journal.
+
+    Full histories live in history/<cnic>.jsonl and are only read by
+    history(). Transactions written since the last snapshot are held in
+    `pending` (and in the journal) until save_all() appends them there.
+    archive_history() moves old months into history/archive.
+
+    users.json layout: {"generation": G, "units": "paisa", "history_bytes": {cnic: n}, "accounts": {...}}.
+    history_bytes is the committed length of each history file, so a crash
+    part-way through save_all() never leaves duplicate transactions behind.
+    The journal starts with the generation it belongs to; a journal older
+    than the snapshot has already been folded in and is discarded.
+
+    With CASHIT_SNAPSHOT=binary (or snapshot_format="binary") the snapshot
+    is written to users.snap instead (see BINARY SNAPSHOT above), which
+    loads without parsing every header. Whichever of the two files was
+    written last is the one read, so a store changes format at its next
+    snapshot, and a users.json copied in is picked up.
+
+    Processes sharing the directory take the users.lock file lock to
+    commit. Each remembers how far it has read the journal; before writing
+    it applies the records other processes appended since (or reloads
+    the snapshot if one of them compacted)."""
+
+    COMPACT_MIN_RECORDS = 1000   # journal is folded into the snapshot after this many records (or one per account, if more)
+
+    def __init__(self, data_file="users.json", journal_file="users.journal", snapshot_format=None):
+        super().__init__()
+        self.snapshot_format = snapshot_format or os.environ.get("CASHIT_SNAPSHOT", "json")
+        if self.snapshot_format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format: {self.snapshot_format}")
+        self.data_file = data_file
+        self.snap_file = os.path.splitext(data_file)[0] + ".snap"
+        self.journal_file = journal_file
+        self.history_dir = os.path.join(os.path.dirname(data_file), "history")
+        self.archive = HistoryArchive(os.path.join(self.history_dir, "archive"))
+        self.users = {}
+        self.pending = {}
+        self.history_bytes = {}
+        self.iban_index = {}
+        self.search_indexes = {}     # "cnic" / "name" -> PrefixIndex, each built by its first search()
+        self.timelines = {}          # cnic -> (history bytes indexed, sorted (timestamp, offset) pairs)
+        self.reference_index = None  # (kind, reference) -> [(cnic, transaction)], built by the first find_payments()
+        self.generation = 0
+        self.journal_records = 0
+        self.journal_in_rupees = False
+        self.lock_path = os.path.splitext(data_file)[0] + ".lock"
+        self.views_lock_path = os.path.splitext(data_file)[0] + ".views.lock"
+        self.lock_handle = None
+        self.lock_depth = 0
+        self.journal_inode = None    # identifies the journal file we have read
+        self.journal_offset = 0      # and how much of it
+
+    @contextmanager
+    def process_lock(self):
+        """Hold commit_lock and the OS lock on users.lock, so no other thread
+        or process commits meanwhile. Re-entrant."""
+        with self.commit_lock:
+            if self.lock_depth == 0:
+                lock_file(self.lock_handle)
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+                if self.lock_depth == 0:
+                    unlock_file(self.lock_handle)
+
+    def load(self, defaults):
+        self.lock_handle = open(self.lock_path, "a+b")
+        with self.process_lock():
+            return self.read_store(defaults)
+
+    def snapshot_file(self):
+        """users.json or users.snap, whichever was written last; None if neither exists"""
+        newest, newest_time = None, None
+        for path in (self.data_file, self.snap_file):
+            try:
+                written = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+            if newest is None or written > newest_time:
+                newest, newest_time = path, written
+        return newest
+
+    def read_store(self, defaults):
+        status = "new"
+        accounts = defaults
+        upgraded = False
+        snapshot_file = self.snapshot_file()
+        binary = snapshot_file == self.snap_file
+
+        if binary:
+            try:
+                self.generation, self.history_bytes, accounts, self.iban_index = read_snapshot_file(self.snap_file)
+                status = "loaded"
+            except Exception:
+                status = "corrupted"
+                binary = False
+                self.generation = 0
+                self.history_bytes = {}
+                accounts = defaults
+        elif snapshot_file:
+            try:
+                with open(self.data_file, "r") as f:
+                    snapshot = json.load(f)
+                if "accounts" in snapshot:
+                    self.generation = snapshot["generation"]
+                    self.history_bytes = snapshot["history_bytes"]
+                    accounts = snapshot["accounts"]
+                else:
+                    # Pre-history layout: {cnic: account with inline transactions}
+                    accounts = snapshot
+                if snapshot.get("units") != "paisa":
+                    # Older snapshots hold rupees as floats
+                    for user in accounts.values():
+                        for field in MONEY_FIELDS:
+                            user[field] = to_paisa(user[field])
+                    upgraded = True
+                status = "loaded"
+            except Exception:
+                status = "corrupted"
+                self.generation = 0
+                self.history_bytes = {}
+                accounts = defaults
+                upgraded = False
+
+        # Binary snapshots only ever hold headers in the current format
+        for cnic, user in accounts.items() if not binary else ():
+            user.setdefault("version", 0)
+            user.setdefault("spending", {})
+            if "transactions" in user:
+                self.pending[cnic] = split_history(user)
+                upgraded = upgraded or status == "loaded"
+            else:
+                # Legacy entries are upgraded once here and saved in the compact form below
+                upgraded = upgraded or not all(is_current_transaction(t) for t in user["recent"])
+                user["recent"] = [upgrade_transaction(t) for t in user["recent"]]
+        self.users = accounts
+
+        self.replay_journal()
+        self.note_journal_position()
+        self.replayed = self.journal_records
+        if not binary:
+            # A binary snapshot brings its IBAN index, which replay kept up to date
+            self.iban_index = {iban_key(u["iban"]): cnic for cnic, u in self.users.items() if u.get("iban")}
+
+        # Rewrite an older users.json once (inline histories, rupee amounts,
+        # dict transactions), so later startups only read headers in the
+        # current format. History files are upgraded line by line as read.
+        # A snapshot in the other format is converted the same way. A new
+        # store is saved at once: views and other processes read the seeded
+        # accounts from the snapshot, never from this process's memory.
+        converted = status == "loaded" and binary != (self.snapshot_format == "binary")
+        if upgraded or self.journal_in_rupees or converted or status == "new":
+            self.save_all()
+        return status
+
+    def __contains__(self, cnic):
+        return cnic in self.users
+
+    def __getitem__(self, cnic):
+        return self.users[cnic]
+
+    def __len__(self):
+        return len(self.users)
+
+    def items(self):
+        # A copy, so sessions opening accounts meanwhile cannot break the iteration
+        return list(self.users.items())
+
+    def history_file(self, cnic):
+        return os.path.join(self.history_dir, f"{cnic}.jsonl")
+
+    def history(self, cnic):
+        with self.commit_lock:
+            size = self.history_bytes.get(cnic, 0)
+            data = b""
+            if size:
+                with open(self.history_file(cnic), "rb") as f:
+                    data = f.read(size)
+            pending = list(self.pending.get(cnic, []))
+            # Read after the live file: another process archives before it rewrites that
+            archived, months = self.archive.history(cnic)
+        live = [upgrade_transaction(json.loads(line)) for line in data.splitlines()]
+        return archived + without_archived(live, months) + pending
+
+    def timeline(self, cnic):
+        """Sorted (timestamp, byte offset) pairs, one per line of the account's
+        history file. Files are only appended to, so an index built earlier
+        is extended with the lines written since. Call with commit_lock held."""
+        size = self.history_bytes.get(cnic, 0)
+        indexed, entries = self.timelines.get(cnic, (0, []))
+        if indexed > size:
+            indexed, entries = 0, []
+        if indexed < size:
+            with open(self.history_file(cnic), "rb") as f:
+                f.seek(indexed)
+                data = f.read(size - indexed)
+            offset = indexed
+            days, clocks = {}, {}
+            for line in data.splitlines(keepends=True):
+                entry = (line_timestamp(line, days, clocks), offset)
+                if entries and entry < entries[-1]:
+                    bisect.insort(entries, entry)   # a backdated line; histories are nearly always in order
+                else:
+                    entries.append(entry)
+                offset += len(line)
+            self.timelines[cnic] = (size, entries)
+        return entries
+
+    def transactions_between(self, cnic, start, end):
+        with self.commit_lock:
+            entries = self.timeline(cnic)
+            offsets = [offset for _, offset in entries[bisect.bisect_left(entries, (start,)):
+                                                       bisect.bisect_right(entries, (end, sys.maxsize))]]
+            # Opened under the lock, so an archive_history() rewriting the
+            # file meanwhile cannot move the lines these offsets point at
+            f = open(self.history_file(cnic), "rb") if offsets else None
+            pending = sorted(
+                (t for t in self.pending.get(cnic, []) if start <= t.timestamp <= end), key=Transaction.timestamp.fget
+            )
+            archived, months = self.archive.history(cnic, start[:7], end[:7])
+
+        def live():
+            if f is not None:
+                with f:
+                    for offset in offsets:
+                        f.seek(offset)
+                        transaction = upgrade_transaction(json.loads(f.readline()))
+                        if month_key(transaction.date) not in months:
+                            yield transaction
+
+        for transaction in archived:
+            if start <= transaction.timestamp <= end:
+                yield transaction
+        yield from heapq.merge(live(), pending, key=Transaction.timestamp.fget)
+
+    def find_payments(self, kind, reference):
+        with self.commit_lock:
+            if self.reference_index is None:
+                self.reference_index = self.build_reference_index()
+            # A payment left live by an interrupted archiving run is also in the archive
+            payments = list(dict.fromkeys(self.reference_index.get((kind, reference), ())))
+        payments.sort(key=lambda payment: payment[1].timestamp)
+        return payments
+
+    def build_reference_index(self):
+        """Index the payments in the archive, the live history files and
+        pending transactions"""
+        index = {}
+        for key, payments in self.archive.payments():
+            index.setdefault(key, []).extend(payments)
+        for cnic, size in self.history_bytes.items():
+            with open(self.history_file(cnic), "rb") as f:
+                data = f.read(size)
+            for line in data.splitlines():
+                if line.endswith(b"null]"):
+                    continue   # no reference, not worth parsing
+                t = upgrade_transaction(json.loads(line))
+                if t.reference is not None:
+                    index.setdefault((t.type, t.reference), []).append((cnic, t))
+        for cnic, transactions in self.pending.items():
+            for t in transactions:
+                if t.reference is not None:
+                    index.setdefault((t.type, t.reference), []).append((cnic, t))
+        return index
+
+    def note_payments(self, entries):
+        super().note_payments(entries)
+        if self.reference_index is not None:
+            for cnic, t in entries:
+                if t.reference is not None:
+                    self.reference_index.setdefault((t.type, t.reference), []).append((cnic, t))
+
+    def forget_payments(self):
+        """Drop the payment index and cache, after changes they cannot follow"""
+        self.reference_index = None
+        self.payment_cache.clear()
+
+    def find_iban(self, iban):
+        return self.iban_index.get(iban_key(iban))
+
+    def search(self, text, anywhere=False):
+        if is_cnic_search(text):
+            field, key = "cnic", text
+        else:
+            field, key = "name", name_key(text)
+        with self.commit_lock:
+            index = self.search_indexes.get(field)
+            if index is None:
+                # The CNIC index needs only the keys, so no header is decoded for it
+                index = self.search_indexes[field] = PrefixIndex(
+                    ((cnic, name_key(u["name"])) for cnic, u in self.users.items()) if field == "name"
+                    else ((cnic, cnic) for cnic in list(self.users))
+                )
+
+        matches = index.containing(key) if anywhere else index.prefix(key)
+        for cnic in matches:
+            acc = self.users.get(cnic)
+            if acc is not None:   # may have been deleted since
+                yield cnic, acc
+
+    def index_account(self, cnic):
+        """Bring the search indexes up to date with a changed or deleted account"""
+        for field, index in self.search_indexes.items():
+            if cnic not in self.users:
+                index.discard(cnic)
+            else:
+                index.set(cnic, name_key(self.users[cnic]["name"]) if field == "name" else cnic)
+
+    def apply_journal_record(self, record):
+        """Apply one journal record to the in-memory accounts"""
+        op = record["op"]
+        cnic = record.get("cnic")
+        version = record.get("version") or record.get("data", {}).get("version")
+
+        if version is not None and cnic in self.users and self.users[cnic]["version"] >= version:
+            return   # already part of this account's state
+
+        if op == "account":
+            data = record["data"]
+            if self.journal_in_rupees:
+                data.update((field, to_paisa(data[field])) for field in MONEY_FIELDS)
+            if cnic in self.users:
+                self.users[cnic].update(data)
+            else:
+                self.users[cnic] = dict(data, recent=[])
+                self.users[cnic].setdefault("version", 0)
+                self.users[cnic].setdefault("spending", {})
+            if data.get("iban"):
+                self.iban_index[iban_key(data["iban"])] = cnic
+            self.index_account(cnic)
+        elif op == "txn":
+            user = self.users[cnic]
+            transaction = upgrade_transaction(record["txn"])
+            push_recent(user, transaction)
+            add_spending(user, transaction)
+            self.pending.setdefault(cnic, []).append(transaction)
+            self.note_payments([(cnic, transaction)])
+            user["balance"] = to_paisa(record["balance"]) if self.journal_in_rupees else record["balance"]
+            if version is not None:
+                user["version"] = version
+        elif op == "delete":
+            user = self.users.pop(cnic, None)
+            if user and user.get("iban"):
+                self.iban_index.pop(iban_key(user["iban"]), None)
+            self.index_account(cnic)
+            self.pending.pop(cnic, None)
+            self.history_bytes.pop(cnic, None)
+        elif op == "batch":
+            for entry in record["records"]:
+                self.apply_journal_record(entry)
+
+    def replay_journal(self):
+        """Re-apply changes written since the last snapshot"""
+        if not os.path.exists(self.journal_file):
+            return
+
+        intact_bytes = 0
+        # Journals without a units marker come from before the paisa format
+        self.journal_in_rupees = True
+        with open(self.journal_file, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete record")
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn record from a crash mid-write; everything before it is intact
+                    break
+                intact_bytes += len(line)
+
+                if record["op"] == "generation":
+                    if record["generation"] != self.generation:
+                        # Left over from before the last snapshot, which already includes it
+                        intact_bytes = 0
+                        break
+                    self.journal_in_rupees = record.get("units") != "paisa"
+                    continue
+
+                try:
+                    self.apply_journal_record(record)
+                except KeyError:
+                    continue
+                self.journal_records += 1
+
+        if intact_bytes == 0:
+            self.journal_in_rupees = False
+
+        # Drop a torn or stale tail so the next append starts on a clean line
+        if intact_bytes < os.path.getsize(self.journal_file):
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(intact_bytes)
+
+    def note_journal_position(self):
+        try:
+            stat = os.stat(self.journal_file)
+            self.journal_inode, self.journal_offset = stat.st_ino, stat.st_size
+        except FileNotFoundError:
+            self.journal_inode, self.journal_offset = None, 0
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return
+        # Cheap check first: nothing to do unless the journal grew or was replaced
+        if (stat.st_ino, stat.st_size) != (self.journal_inode, self.journal_offset):
+            with self.process_lock():
+                self.sync()
+
+    def sync(self, changing=None):
+        """Apply what other processes committed since we last read the journal.
+
+        `changing` maps the CNICs about to be written to the version they
+        were read at. If another process committed any of them meanwhile,
+        VersionConflict is raised before that change is applied.
+        Call with process_lock() held."""
+        changing = changing or {}
+        try:
+            stat = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return
+
+        # Inode numbers are reused, so the generation header is what tells
+        # us another process compacted
+        with open(self.journal_file, "rb") as f:
+            header = json.loads(f.readline() or b"{}")
+        if header.get("generation", self.generation) != self.generation:
+            self.reload_snapshot(changing)
+            self.journal_offset = 0
+        elif stat.st_ino != self.journal_inode:
+            self.journal_offset = 0   # created by another process's first commit
+        self.journal_inode = stat.st_ino
+
+        if stat.st_size > self.journal_offset:
+            self.apply_journal_tail(changing)
+
+    def check_conflicts(self, changing, changes):
+        """changes: (cnic, version) pairs committed elsewhere; None means deleted"""
+        for cnic, version in changes:
+            if cnic not in changing:
+                continue
+            if version is None:
+                raise AccountGone(f"account {cnic} was deleted by another process")
+            if version > changing[cnic]:
+                raise VersionConflict(f"account {cnic} was changed by another process")
+
+    def check_present(self, accounts):
+        """Raise AccountGone for any of `accounts` deleted since it was read,
+        by this process or (as sync() has just applied) another one. Call
+        with process_lock() held."""
+        for acc in accounts:
+            if acc["cnic"] not in self.users:
+                raise AccountGone(f"account {acc['cnic']} no longer exists")
+
+    def reload_snapshot(self, changing):
+        """Another process compacted the journal: its snapshot is the new base"""
+        if self.snapshot_file() == self.snap_file:
+            generation, history_bytes, accounts, iban_index = read_snapshot_file(self.snap_file)
+        else:
+            with open(self.data_file, "rb") as f:
+                generation, history_bytes, accounts, iban_index = load_json_snapshot(f)
+
+        self.check_conflicts(changing, [
+            (cnic, accounts[cnic].get("version", 0) if cnic in accounts else None)
+            for cnic in changing if cnic in accounts or cnic in self.users
+        ])
+
+        # Headers are live, so the ones already handed out are updated in
+        # place and carried over; headers of a binary snapshot that nobody
+        # has read yet stay undecoded
+        users = self.users
+        live = list(users.decoded.items() if isinstance(users, SnapshotHeaders) else users.items())
+        for cnic, acc in live:
+            if cnic in accounts:
+                data = accounts[cnic]
+                if acc["version"] != data["version"]:
+                    acc.update(data)
+                accounts[cnic] = acc
+        self.users = accounts
+
+        self.iban_index = iban_index
+        self.search_indexes = {}   # rebuilt by the next search
+        self.timelines = {}        # the history files may have been archived
+        self.forget_payments()
+        self.generation = generation
+        self.history_bytes = history_bytes
+        self.pending = {}   # the compacting process had already applied them
+        self.journal_records = 0
+        self.change_count += 1
+
+    def apply_journal_tail(self, changing):
+        with open(self.journal_file, "rb") as f:
+            f.seek(self.journal_offset)
+            data = f.read()
+
+        records = []
+        intact_bytes = 0
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("incomplete record")
+                record = json.loads(line)
+            except ValueError:
+                break   # torn by a writer that crashed
+            intact_bytes += len(line)
+            if record["op"] != "generation":
+                records.append(record)
+
+        changes = []
+        for record in records:
+            for entry in record.get("records", [record]):
+                version = entry.get("version") or entry.get("data", {}).get("version")
+                changes.append((entry["cnic"], None if entry["op"] == "delete" else version or 0))
+        self.check_conflicts(changing, changes)
+
+        for record in records:
+            try:
+                self.apply_journal_record(record)
+            except KeyError:
+                continue
+            self.journal_records += len(record.get("records", [record]))
+            self.change_count += 1
+
+        self.journal_offset += intact_bytes
+        if intact_bytes < len(data):
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(self.journal_offset)
+
+    def flush_history(self):
+        """Append pending transactions to their history files"""
+        if self.pending:
+            os.makedirs(self.history_dir, exist_ok=True)
+        # One sync for all the files rather than one each, where the OS has it
+        sync_each = not hasattr(os, "sync")
+
+        for cnic, transactions in self.pending.items():
+            if cnic not in self.users or not transactions:
+                continue
+            with open(self.history_file(cnic), "ab") as f:
+                # Anything past the committed length is from an interrupted save_all().
+                # (A file archive_history() rewrote just before a crash is shorter.)
+                if f.tell() > self.history_bytes.get(cnic, 0):
+                    f.truncate(self.history_bytes.get(cnic, 0))
+                f.write(b"".join(json.dumps(t).encode() + b"\n" for t in transactions))
+                if sync_each:
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.history_bytes[cnic] = f.tell()
+        if self.pending and not sync_each:
+            os.sync()
+
+    @metrics.timed("save")
+    def save_all(self):
+        """Write a full snapshot of all account headers and start a fresh journal"""
+        with self.process_lock():
+            self.sync()
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        history_bytes = dict(self.history_bytes)
+        try:
+            self.flush_history()
+            if self.snapshot_format == "binary":
+                data = encode_snapshot(self.generation + 1, self.history_bytes, self.users, self.iban_index)
+                write_atomic(self.snap_file, data)
+                stale_file = self.data_file
+            else:
+                data = encode_json_snapshot(self.generation + 1, self.history_bytes, self.users)
+                write_atomic(self.data_file, data)
+                stale_file = self.snap_file
+        except Exception:
+            self.history_bytes = history_bytes
+            raise
+
+        # The snapshot in the other format is now out of date
+        try:
+            os.remove(stale_file)
+        except FileNotFoundError:
+            pass
+        self.generation += 1
+        self.pending = {}
+        write_atomic(self.journal_file, self.journal_header())
+        self.note_journal_position()
+        self.journal_records = 0
+        self.journal_in_rupees = False
+
+    def journal_header(self):
+        return json.dumps({"op": "generation", "generation": self.generation, "units": "paisa"}) + "\n"
+
+    def append_journal(self, record, changes=1):
+        """Append a single change (or one atomic batch of `changes`) to the journal
+        instead of rewriting the whole file"""
+        with open(self.journal_file, "a") as f:
+            if f.tell() == 0:
+                f.write(self.journal_header())
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+            # We were caught up before writing, so the file now ends with our record
+            self.journal_inode = os.fstat(f.fileno()).st_ino
+            self.journal_offset = f.tell()
+
+        self.journal_records += changes
+        self.change_count += 1
+
+    def compact(self):
+        """save_all() for housekeeping: the journal already holds every change,
+        so a failure here is left for the next attempt"""
+        try:
+            self.save_all()
+        except OSError:
+            pass
+
+    def maybe_compact(self):
+        # Compacting once per len(users) records keeps the amortized cost of a save constant
+        if self.journal_records >= max(self.COMPACT_MIN_RECORDS, len(self.users)):
+            self.compact()
+
+    @metrics.timed("commit")
+    def put_account(self, acc):
+        acc.setdefault("version", 0)
+        with self.process_lock():
+            self.sync({acc["cnic"]: acc["version"]})
+            if acc["version"]:
+                self.check_present([acc])   # else a new account
+            if "transactions" in acc:
+                self.pending[acc["cnic"]] = split_history(acc)
+            self.users[acc["cnic"]] = acc
+            if acc.get("iban"):
+                self.iban_index[iban_key(acc["iban"])] = acc["cnic"]
+            self.index_account(acc["cnic"])
+            data = {key: value for key, value in acc.items() if key != "recent"}
+            data["version"] += 1
+            self.append_journal({"op": "account", "cnic": acc["cnic"], "data": data})
+            acc["version"] = data["version"]
+            self.maybe_compact()
+
+    def add_transaction(self, acc, transaction):
+        self.add_transactions([(acc, transaction)])
+
+    @metrics.timed("commit")
+    def add_transactions(self, entries, headers=()):
+        with self.process_lock():
+            accounts = [acc for acc, _ in entries] + list(headers)
+            self.sync({acc["cnic"]: acc["version"] for acc in accounts})
+            self.check_present(accounts)
+
+            versions = {}
+            records = []
+            for acc, t in entries:
+                version = versions[acc["cnic"]] = versions.get(acc["cnic"], acc["version"]) + 1
+                records.append({"op": "txn", "cnic": acc["cnic"], "txn": t, "balance": acc["balance"], "version": version})
+            for acc in headers:
+                data = {key: value for key, value in acc.items() if key != "recent"}
+                data["version"] = versions[acc["cnic"]] = versions.get(acc["cnic"], acc["version"]) + 1
+                records.append({"op": "account", "cnic": acc["cnic"], "data": data})
+
+            # One journal line is written (and replayed) all-or-nothing
+            if len(records) == 1:
+                self.append_journal(records[0])
+            else:
+                self.append_journal({"op": "batch", "records": records}, len(records))
+            for acc, transaction in entries:
+                self.pending.setdefault(acc["cnic"], []).append(transaction)
+            self.note_payments([(acc["cnic"], transaction) for acc, transaction in entries])
+            for acc in accounts:
+                acc["version"] = versions[acc["cnic"]]
+            self.maybe_compact()
+
+    @metrics.timed("commit")
+    def import_accounts(self, entries):
+        """Add many new (account header, transactions) pairs and write one snapshot.
+        Raises VersionConflict, adding none of them, if a CNIC or IBAN is
+        already taken, e.g. by an account another process opened since the
+        caller checked.
+
+        History files are not synced one by one: nothing points at them until
+        the snapshot is written, so a crash before that leaves only bytes the
+        next flush truncates away."""
+        with self.process_lock():
+            self.sync()
+            os.makedirs(self.history_dir, exist_ok=True)
+            added = []
+            try:
+                for acc, transactions in entries:
+                    cnic = acc["cnic"]
+                    if cnic in self.users:
+                        raise VersionConflict(f"account {cnic} was opened by another process")
+                    if acc.get("iban") and iban_key(acc["iban"]) in self.iban_index:
+                        raise VersionConflict(f"IBAN {acc['iban']} was taken by another process")
+                    acc.setdefault("version", 0)
+                    acc.setdefault("spending", {})
+                    acc["recent"] = list(transactions[-RECENT_TRANSACTIONS:])
+                    self.users[cnic] = acc
+                    added.append(acc)
+                    if acc.get("iban"):
+                        self.iban_index[iban_key(acc["iban"])] = cnic
+                    self.index_account(cnic)
+                    if transactions:
+                        with open(self.history_file(cnic), "ab") as f:
+                            f.truncate(self.history_bytes.get(cnic, 0))
+                            f.write(b"".join(json.dumps(t).encode() + b"\n" for t in transactions))
+                            self.history_bytes[cnic] = f.tell()
+            except VersionConflict:
+                # Nothing points at the history files written so far
+                for acc in reversed(added):
+                    del self.users[acc["cnic"]]
+                    if acc.get("iban"):
+                        del self.iban_index[iban_key(acc["iban"])]
+                    self.index_account(acc["cnic"])
+                    self.history_bytes.pop(acc["cnic"], None)
+                raise
+            if hasattr(os, "sync"):
+                os.sync()
+            self.write_snapshot()
+            self.forget_payments()
+            self.change_count += 1
+
+    @metrics.timed("commit")
+    def delete_account(self, cnic):
+        with self.views_excluded(), self.process_lock():
+            self.sync()
+            user = self.users.pop(cnic, None)
+            if user and user.get("iban") and self.iban_index.get(iban_key(user["iban"])) == cnic:
+                del self.iban_index[iban_key(user["iban"])]
+            self.index_account(cnic)
+            self.append_journal({"op": "delete", "cnic": cnic})
+            self.pending.pop(cnic, None)
+            if self.history_bytes.pop(cnic, None) is not None:
+                os.remove(self.history_file(cnic))
+            self.timelines.pop(cnic, None)
+            self.archive.forget(cnic)
+            self.forget_payments()
+            self.maybe_compact()
+
+    @metrics.timed("archive")
+    def archive_history(self, before):
+        """Every line of a history file is checked, as older files (and
+        seeded ones) are not in date order. Pending transactions are written
+        out first. The archive is committed first, then the files are
+        rewritten with what is left, then a snapshot records their lengths."""
+        with self.views_excluded(), self.process_lock():
+            self.sync()
+            if self.pending:
+                self.write_snapshot()   # journalled transactions of old months move too
+            archived = self.archive.months_by_account()
+            moved = {}        # month -> {cnic: transactions}
+            remaining = {}    # cnic -> what stays in the history file
+            for cnic, size in list(self.history_bytes.items()):
+                with open(self.history_file(cnic), "rb") as f:
+                    lines = f.read(size).splitlines(keepends=True)
+                kept = []
+                for line in lines:
+                    transaction = upgrade_transaction(json.loads(line))
+                    month = month_key(transaction.date)
+                    if month >= before:
+                        kept.append(line)
+                    elif month not in archived.get(cnic, ()):   # else left behind by an interrupted run
+                        moved.setdefault(month, {}).setdefault(cnic, []).append(transaction)
+                if len(kept) < len(lines):
+                    remaining[cnic] = b"".join(kept)
+
+            for month, histories in sorted(moved.items()):
+                self.archive.add(month, histories)
+            # One sync for all the rewritten files rather than one each, as in import_accounts()
+            for cnic, data in remaining.items():
+                if data:
+                    with open(self.history_file(cnic) + ".tmp", "wb") as f:
+                        f.write(data)
+            if hasattr(os, "sync"):
+                os.sync()
+            for cnic, data in remaining.items():
+                if data:
+                    os.replace(self.history_file(cnic) + ".tmp", self.history_file(cnic))
+                    self.history_bytes[cnic] = len(data)
+                else:
+                    os.remove(self.history_file(cnic))
+                    del self.history_bytes[cnic]
+                self.timelines.pop(cnic, None)
+            self.write_snapshot()
+            self.forget_payments()
+            self.change_count += 1
+        return sum(len(transactions) for histories in moved.values() for transactions in histories.values())
+
+    def view(self):
+        views_lock = self.hold_views_lock()
+        try:
+            with self.process_lock():
+                self.sync()
+                path = self.snapshot_file()
+                snapshot = pin_file(path) if path else None
+                journal = pin_file(self.journal_file, self.journal_offset) if self.journal_offset else None
+                return JsonView(self, snapshot, path == self.snap_file, journal, self.journal_offset, views_lock)
+        except Exception:
+            release_views_lock(views_lock)
+            raise
+
+    def close(self):
+        if self.lock_handle is not None:
+            self.lock_handle.close()
+            self.lock_handle = None
+
+
+class JsonView(JsonBackend):
+    """A JsonBackend frozen at the moment JsonBackend.view() was called.
+
+    Snapshots and journals are only replaced by rename or appended to, so
+    the snapshot file and the journal length held from that moment keep
+    their contents whatever is committed later. History files are read up
+    to the lengths of that moment, and the views lock keeps them from being
+    rewritten or removed meanwhile. The files are parsed on first use, in
+    the thread using the view rather than the one that took it."""
+
+    def __init__(self, store, snapshot, binary, journal, journal_bytes, views_lock):
+        super().__init__(store.data_file, store.journal_file, store.snapshot_format)
+        self.pinned = (snapshot, binary, journal, journal_bytes)
+        self.views_lock = views_lock
+        self.taken = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.opened = False
+
+    def open(self):
+        with self.commit_lock:
+            if self.opened:
+                return
+            snapshot, binary, journal, journal_bytes = self.pinned
+            if binary:
+                self.generation, self.history_bytes, self.users, self.iban_index = read_snapshot(snapshot, self.snap_file)
+            elif snapshot:
+                self.generation, self.history_bytes, self.users, self.iban_index = load_json_snapshot(snapshot)
+
+            records = [json.loads(line) for line in journal.read(journal_bytes).splitlines()] if journal else []
+            if records and records[0]["op"] == "generation":
+                # A journal left from before the snapshot is already part of it
+                records = records[1:] if records[0]["generation"] == self.generation else []
+            for record in records:
+                try:
+                    self.apply_journal_record(record)
+                except KeyError as e:
+                    # The pinned snapshot and journal do not belong together
+                    raise ValueError(f"{self.journal_file} changes an account missing from the snapshot: {e}") from None
+            self.opened = True
+
+    def refresh(self):
+        pass   # stays at its moment
+
+    def items(self):
+        self.open()
+        return super().items()
+
+    def history(self, cnic):
+        self.open()
+        return super().history(cnic)
+
+    def close(self):
+        snapshot, _, journal, _ = self.pinned
+        for f in (snapshot, journal):
+            if f is not None:
+                f.close()
+        self.pinned = (None, False, None, 0)
+        if self.views_lock is not None:
+            release_views_lock(self.views_lock)
+            self.views_lock = None
+
+
+# ---------------- SQLITE ----------------
+
+# 1: money in integer paisa, transactions with a numeric sign
+# 2: every transaction has a type code
+# 3: accounts carry a version counter
+# 4: spending totals per account, month and type (filled by batch.py rebuild-spending)
+# 5: transactions carry a sortable timestamp (ts), indexed per account
+# 6: standing orders per account, indexed by their next run date
+# 7: payments carry their reference, indexed by type and reference
+SCHEMA_VERSION = 7
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    cnic             TEXT PRIMARY KEY,
+    name             TEXT NOT NULL,
+    iban             TEXT,
+    pin              TEXT NOT NULL,
+    balance          INTEGER NOT NULL,
+    savings          INTEGER NOT NULL,
+    monthly_spending INTEGER NOT NULL,
+    version          INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS accounts_iban ON accounts (iban);
+CREATE INDEX IF NOT EXISTS accounts_iban_key ON accounts (REPLACE(UPPER(iban), ' ', ''));
+CREATE INDEX IF NOT EXISTS accounts_name_key ON accounts (LOWER(TRIM(name)), cnic);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    cnic          TEXT NOT NULL,
+    description   TEXT NOT NULL,
+    date          TEXT NOT NULL,
+    time          TEXT,
+    amount        INTEGER NOT NULL,
+    sign          INTEGER NOT NULL,
+    type          TEXT NOT NULL,
+    balance_after INTEGER,
+    ts            TEXT,
+    reference     TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_cnic ON transactions (cnic, id);
+CREATE INDEX IF NOT EXISTS transactions_cnic_ts ON transactions (cnic, ts);
+CREATE INDEX IF NOT EXISTS transactions_reference ON transactions (type, reference) WHERE reference IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS spending (
+    cnic   TEXT NOT NULL,
+    month  TEXT NOT NULL,
+    type   TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    PRIMARY KEY (cnic, month, type)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS standing_orders (
+    cnic      TEXT NOT NULL,
+    id        INTEGER NOT NULL,
+    kind      TEXT NOT NULL,
+    reference TEXT NOT NULL,
+    amount    INTEGER NOT NULL,
+    every     TEXT NOT NULL,
+    day       INTEGER NOT NULL,
+    next      TEXT NOT NULL,
+    PRIMARY KEY (cnic, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS standing_orders_next ON standing_orders (next);
+"""
+
+SELECT_TRANSACTIONS = f"SELECT {', '.join(TRANSACTION_FIELDS)} FROM transactions"
+INSERT_TRANSACTION = (
+    f"INSERT INTO transactions (cnic, {', '.join(TRANSACTION_FIELDS)}, ts) "
+    f"VALUES ({', '.join('?' * (len(TRANSACTION_FIELDS) + 2))})"
+)
+INSERT_ACCOUNT = (
+    f"INSERT OR REPLACE INTO accounts ({', '.join(ACCOUNT_FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(ACCOUNT_FIELDS))})"
+)
+INSERT_NEW_ACCOUNT = (
+    f"INSERT INTO accounts ({', '.join(ACCOUNT_FIELDS)}) "
+    f"VALUES ({', '.join('?' * len(ACCOUNT_FIELDS))})"
+)
+INSERT_SPENDING = "INSERT OR REPLACE INTO spending (cnic, month, type, amount) VALUES (?, ?, ?, ?)"
+INSERT_STANDING_ORDER = (
+    f"INSERT INTO standing_orders (cnic, {', '.join(STANDING_ORDER_FIELDS)}) "
+    f"VALUES ({', '.join('?' * (len(STANDING_ORDER_FIELDS) + 1))})"
+)
+HEADER_FIELDS = tuple(field for field in ACCOUNT_FIELDS if field not in ("cnic", "version"))
+# Only succeeds if nobody committed the account since it was read
+UPDATE_ACCOUNT = (
+    f"UPDATE accounts SET {', '.join(f'{field} = ?' for field in HEADER_FIELDS)}, version = version + 1 "
+    f"WHERE cnic = ? AND version = ?"
+)
+
+
+def transaction_to_row(cnic, t):
+    t = upgrade_transaction(t)
+    return (cnic,) + tuple(t) + (t.timestamp,)
+
+
+def row_to_transaction(row):
+    return make_transaction(*row)
+
+
+def spending_rows(cnic, spending):
+    return [(cnic, month, kind, amount) for month, totals in spending.items() for kind, amount in totals.items()]
+
+
+def standing_order_rows(cnic, orders):
+    return [(cnic,) + tuple(order[field] for field in STANDING_ORDER_FIELDS) for order in orders]
+
+
+class SqliteBackend(StorageBackend):
+    """Accounts and transactions in an embedded SQLite database.
+
+    Only the rows a screen needs are read: an account header and its
+    recent transactions are fetched on first access and then kept in
+    memory; full histories are queried by history(). The one connection
+    is shared by all threads, so every use of it holds commit_lock.
+
+    Writes compare-and-set the account's version, so a process holding a
+    stale header gets VersionConflict; refresh() reloads the cached headers
+    that other processes changed.
+
+    archive_history() moves old months out of the transactions table into
+    archive/ next to the database."""
+
+    def __init__(self, db_file="cashit.db"):
+        super().__init__()
+        self.db_file = db_file
+        self.archive = HistoryArchive(os.path.join(os.path.dirname(db_file), "archive"))
+        self.views_lock_path = os.path.splitext(db_file)[0] + ".views.lock"
+        self.conn = None
+        self.cache = {}
+        self.data_version = None
+
+    def load(self, defaults):
+        is_new = not os.path.exists(self.db_file)
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if not is_new and version < SCHEMA_VERSION:
+            self.upgrade_schema(version)
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+        if is_new or len(self) == 0:
+            self.import_accounts((acc, split_history(acc)) for acc in defaults.values())
+            return "new"
+        return "loaded"
+
+    def upgrade_schema(self, version):
+        """Bring a database written by an older version up to SCHEMA_VERSION, in one transaction"""
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "accounts" not in tables:
+            return
+
+        self.conn.execute("BEGIN")
+        try:
+            if version < 1:
+                self.rebuild_in_paisa()
+            if version < 2:
+                # The same codes upgrade_transaction() gives legacy entries
+                self.conn.execute(
+                    "UPDATE transactions SET type = CASE WHEN sign > 0 THEN 'credit' ELSE 'debit' END "
+                    "WHERE type IS NULL"
+                )
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(accounts)")}
+            if "version" not in columns:
+                self.conn.execute("ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            columns = {row[1] for row in self.conn.execute("PRAGMA table_info(transactions)")}
+            if "ts" not in columns:
+                self.conn.execute("ALTER TABLE transactions ADD COLUMN ts TEXT")
+                self.conn.create_function("sortable_time", 2, sortable_time, deterministic=True)
+                self.conn.execute("UPDATE transactions SET ts = sortable_time(date, time)")
+            if "reference" not in columns:
+                self.conn.execute("ALTER TABLE transactions ADD COLUMN reference TEXT")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def rebuild_in_paisa(self):
+        """Version 0 kept rupees as REAL and amounts as display text"""
+        for index in ("accounts_iban", "accounts_iban_key", "accounts_name_key", "transactions_cnic"):
+            self.conn.execute(f"DROP INDEX IF EXISTS {index}")
+        self.conn.execute("ALTER TABLE accounts RENAME TO accounts_v0")
+        self.conn.execute("ALTER TABLE transactions RENAME TO transactions_v0")
+        for statement in SCHEMA.split(";"):
+            if statement.strip():
+                self.conn.execute(statement)
+
+        fields = ACCOUNT_FIELDS[:-1]   # no version column yet
+        rows = self.conn.execute(f"SELECT {', '.join(fields)} FROM accounts_v0")
+        self.conn.executemany(INSERT_ACCOUNT, (
+            [to_paisa(value) if field in MONEY_FIELDS else value for field, value in zip(fields, row)] + [0]
+            for row in rows
+        ))
+
+        rows = self.conn.execute(
+            "SELECT cnic, description, date, time, amount, type, balance_after FROM transactions_v0 ORDER BY id"
+        )
+        self.conn.executemany(INSERT_TRANSACTION, (
+            transaction_to_row(row[0], [row[1], row[2], row[4]] if row[5] is None else {
+                "description": row[1], "date": row[2], "time": row[3],
+                "amount": row[4], "type": row[5], "balance_after": row[6]
+            })
+            for row in rows
+        ))
+
+        self.conn.execute("DROP TABLE accounts_v0")
+        self.conn.execute("DROP TABLE transactions_v0")
+
+    @metrics.timed("commit")
+    def import_accounts(self, entries):
+        """Insert many new (account header, transactions) pairs in one database
+        transaction. Raises VersionConflict, inserting none of them, if a
+        CNIC or IBAN is already taken, e.g. by an account another process
+        opened since the caller checked."""
+        with self.commit_lock, self.conn:
+            ibans = []
+            for acc, transactions in entries:
+                acc.setdefault("version", 0)
+                try:
+                    self.conn.execute(INSERT_NEW_ACCOUNT, [acc[field] for field in ACCOUNT_FIELDS])
+                except sqlite3.IntegrityError:
+                    raise VersionConflict(f"account {acc['cnic']} was opened by another process")
+                if acc.get("iban"):
+                    ibans.append(iban_key(acc["iban"]))
+                self.conn.executemany(INSERT_TRANSACTION, [transaction_to_row(acc["cnic"], t) for t in transactions])
+                self.conn.executemany(INSERT_SPENDING, spending_rows(acc["cnic"], acc.get("spending", {})))
+                self.conn.executemany(INSERT_STANDING_ORDER, standing_order_rows(acc["cnic"], acc.get("standing_orders", [])))
+
+            # IBANs are not unique in the schema. The inserts hold the write
+            # lock, so no other process can take one of these until we commit.
+            for start in range(0, len(ibans), self.HEADER_CHUNK):
+                chunk = ibans[start:start + self.HEADER_CHUNK]
+                taken = self.conn.execute(
+                    f"SELECT REPLACE(UPPER(iban), ' ', '') FROM accounts "
+                    f"WHERE REPLACE(UPPER(iban), ' ', '') IN ({', '.join('?' * len(chunk))}) "
+                    f"GROUP BY 1 HAVING COUNT(*) > 1 LIMIT 1",
+                    chunk
+                ).fetchone()
+                if taken:
+                    raise VersionConflict(f"IBAN {taken[0]} was taken by another process")
+            self.payment_cache.clear()
+            self.change_count += 1
+
+    def __contains__(self, cnic):
+        if cnic in self.cache:
+            return True
+        with self.commit_lock:
+            row = self.conn.execute("SELECT 1 FROM accounts WHERE cnic = ?", (cnic,)).fetchone()
+        return row is not None
+
+    def __getitem__(self, cnic):
+        if cnic in self.cache:
+            return self.cache[cnic]
+
+        with self.commit_lock:
+            # Checked again: another session may have loaded it while we waited
+            if cnic in self.cache:
+                return self.cache[cnic]
+
+            row = self.conn.execute(
+                f"SELECT {', '.join(ACCOUNT_FIELDS)} FROM accounts WHERE cnic = ?", (cnic,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(cnic)
+
+            acc = dict(zip(ACCOUNT_FIELDS, row))
+            acc["recent"] = self.recent_transactions(cnic)
+            acc["spending"] = self.load_spending("WHERE cnic = ?", (cnic,)).get(cnic, {})
+            acc["standing_orders"] = self.load_standing_orders("WHERE cnic = ?", (cnic,)).get(cnic, [])
+            self.cache[cnic] = acc
+        return acc
+
+    def load_spending(self, where="", params=()):
+        """{cnic: {month: {type: paisa}}} from the spending table"""
+        spending = {}
+        for cnic, month, kind, amount in self.conn.execute(f"SELECT cnic, month, type, amount FROM spending {where}", params):
+            spending.setdefault(cnic, {}).setdefault(month, {})[kind] = amount
+        return spending
+
+    def load_standing_orders(self, where="", params=()):
+        """{cnic: [standing order, ...]} from the standing_orders table"""
+        orders = {}
+        rows = self.conn.execute(
+            f"SELECT cnic, {', '.join(STANDING_ORDER_FIELDS)} FROM standing_orders {where} ORDER BY cnic, id", params
+        )
+        for row in rows:
+            orders.setdefault(row[0], []).append(dict(zip(STANDING_ORDER_FIELDS, row[1:])))
+        return orders
+
+    def recent_transactions(self, cnic):
+        rows = self.conn.execute(
+            f"{SELECT_TRANSACTIONS} WHERE cnic = ? ORDER BY id DESC LIMIT ?", (cnic, RECENT_TRANSACTIONS)
+        ).fetchall()
+        return [row_to_transaction(r) for r in reversed(rows)]
+
+    def refresh(self):
+        with self.commit_lock:
+            # data_version only moves when another connection commits
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self.data_version:
+                return
+            self.data_version = data_version
+            self.change_count += 1
+            self.payment_cache.clear()
+
+            cnics = list(self.cache)
+            for start in range(0, len(cnics), 500):
+                chunk = cnics[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT {', '.join(ACCOUNT_FIELDS)} FROM accounts WHERE cnic IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for row in rows:
+                    fresh = dict(zip(ACCOUNT_FIELDS, row))
+                    acc = self.cache[fresh["cnic"]]
+                    if acc["version"] != fresh["version"]:
+                        acc.update(fresh)   # headers are live, so update in place
+                        acc["recent"] = self.recent_transactions(acc["cnic"])
+                        acc["spending"] = self.load_spending("WHERE cnic = ?", (acc["cnic"],)).get(acc["cnic"], {})
+                        acc["standing_orders"] = self.load_standing_orders("WHERE cnic = ?", (acc["cnic"],)).get(acc["cnic"], [])
+                for cnic in set(chunk) - {row[1] for row in rows}:
+                    del self.cache[cnic]   # deleted by another process
+
+    def __len__(self):
+        with self.commit_lock:
+            return self.conn.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def items(self):
+        with self.commit_lock:
+            rows = self.conn.execute(f"SELECT {', '.join(ACCOUNT_FIELDS)} FROM accounts ORDER BY rowid").fetchall()
+            spending = self.load_spending()
+        for row in rows:
+            acc = self.cache.get(row[1]) or dict(zip(ACCOUNT_FIELDS, row), spending=spending.get(row[1], {}))
+            yield acc["cnic"], acc
+
+    def history(self, cnic):
+        with self.commit_lock:
+            rows = self.conn.execute(f"{SELECT_TRANSACTIONS} WHERE cnic = ? ORDER BY id", (cnic,)).fetchall()
+            # Read after the rows: another process archives before it deletes them
+            archived, months = self.archive.history(cnic)
+        return archived + without_archived([row_to_transaction(r) for r in rows], months)
+
+    def find_iban(self, iban):
+        # Matches the accounts_iban_key expression index
+        with self.commit_lock:
+            row = self.conn.execute(
+                "SELECT cnic FROM accounts WHERE REPLACE(UPPER(iban), ' ', '') = ?", (iban_key(iban),)
+            ).fetchone()
+        return row[0] if row else None
+
+    HEADER_CHUNK = 500   # accounts per query when reading headers in bulk
+
+    def headers(self, cnics):
+        found = {}
+        with self.commit_lock:
+            missing = []
+            for cnic in dict.fromkeys(cnics):
+                if cnic in self.cache:
+                    found[cnic] = self.cache[cnic]
+                else:
+                    missing.append(cnic)
+
+            for start in range(0, len(missing), self.HEADER_CHUNK):
+                chunk = missing[start:start + self.HEADER_CHUNK]
+                where = f"WHERE cnic IN ({', '.join('?' * len(chunk))})"
+                rows = self.conn.execute(f"SELECT {', '.join(ACCOUNT_FIELDS)} FROM accounts {where}", chunk).fetchall()
+                recent = {}
+                for row in self.conn.execute(
+                    f"SELECT cnic, {', '.join(TRANSACTION_FIELDS)} FROM ("
+                    f"SELECT *, ROW_NUMBER() OVER (PARTITION BY cnic ORDER BY id DESC) AS position "
+                    f"FROM transactions {where}) WHERE position <= ? ORDER BY cnic, id",
+                    chunk + [RECENT_TRANSACTIONS]
+                ):
+                    recent.setdefault(row[0], []).append(row_to_transaction(row[1:]))
+                spending = self.load_spending(where, chunk)
+                orders = self.load_standing_orders(where, chunk)
+
+                for row in rows:
+                    cnic = row[1]
+                    acc = dict(zip(ACCOUNT_FIELDS, row))
+                    acc["recent"] = recent.get(cnic, [])
+                    acc["spending"] = spending.get(cnic, {})
+                    acc["standing_orders"] = orders.get(cnic, [])
+                    found[cnic] = self.cache[cnic] = acc
+        return found
+
+    def existing(self, cnics):
+        cnics = list(cnics)
+        found = set()
+        with self.commit_lock:
+            for start in range(0, len(cnics), self.HEADER_CHUNK):
+                chunk = cnics[start:start + self.HEADER_CHUNK]
+                found.update(cnic for cnic, in self.conn.execute(
+                    f"SELECT cnic FROM accounts WHERE cnic IN ({', '.join('?' * len(chunk))})", chunk
+                ))
+        return found
+
+    def find_ibans(self, ibans):
+        keys = list({iban_key(iban) for iban in ibans})
+        owners = {}
+        with self.commit_lock:
+            for start in range(0, len(keys), self.HEADER_CHUNK):
+                chunk = keys[start:start + self.HEADER_CHUNK]
+                owners.update(self.conn.execute(
+                    f"SELECT REPLACE(UPPER(iban), ' ', ''), cnic FROM accounts "
+                    f"WHERE REPLACE(UPPER(iban), ' ', '') IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                ))
+        return {iban: owners[iban_key(iban)] for iban in ibans if iban_key(iban) in owners}
+
+    LEDGER_CHUNK = 10000
+
+    def ledger(self):
+        # The archive segment by segment, then one pass over the table in
+        # id order, a chunk at a time
+        archived = set()
+        for month, cnic, transactions in self.archive.entries():
+            archived.add((cnic, month))
+            for transaction in transactions:
+                yield cnic, transaction
+
+        last_id = 0
+        while True:
+            with self.commit_lock:
+                rows = self.conn.execute(
+                    f"SELECT id, cnic, {', '.join(TRANSACTION_FIELDS)} FROM transactions WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.LEDGER_CHUNK)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                if archived and (row[1], month_key(row[3])) in archived:
+                    continue   # left behind by an interrupted archive_history()
+                yield row[1], row_to_transaction(row[2:])
+            last_id = rows[-1][0]
+
+    def transactions_between(self, cnic, start, end):
+        # The archived months in range, then the table a chunk at a time
+        # through the (cnic, ts) index
+        with self.commit_lock:
+            archived, months = self.archive.history(cnic, start[:7], end[:7])
+        for transaction in archived:
+            if start <= transaction.timestamp <= end:
+                yield transaction
+
+        last = ("", 0)
+        while True:
+            with self.commit_lock:
+                rows = self.conn.execute(
+                    f"SELECT ts, id, {', '.join(TRANSACTION_FIELDS)} FROM transactions "
+                    f"WHERE cnic = ? AND ts <= ? AND (ts, id) > (?, ?) AND ts >= ? ORDER BY ts, id LIMIT ?",
+                    (cnic, end) + last + (start, self.LEDGER_CHUNK)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                if month_key(row[3]) not in months:
+                    yield row_to_transaction(row[2:])
+            last = rows[-1][:2]
+
+    SEARCH_CHUNK = 200   # rows fetched per query while paging through search results
+
+    def find_payments(self, kind, reference):
+        with self.commit_lock:
+            rows = self.conn.execute(
+                f"SELECT id, cnic, {', '.join(TRANSACTION_FIELDS)} FROM transactions "
+                f"WHERE type = ? AND reference = ? ORDER BY ts, id",
+                (kind, reference)
+            ).fetchall()
+            archived = self.archive.find_payments(kind, reference)
+        payments = list(dict.fromkeys(archived + [(row[1], row_to_transaction(row[2:])) for row in rows]))
+        payments.sort(key=lambda payment: payment[1].timestamp)
+        return payments
+
+    def search(self, text, anywhere=False):
+        # Both match the accounts primary key / accounts_name_key index
+        if is_cnic_search(text):
+            column, key = "cnic", text
+        else:
+            column, key = "LOWER(TRIM(name))", name_key(text)
+        if anywhere:
+            where, params = f"INSTR({column}, ?) > 0", [key]
+        else:
+            where, params = f"{column} >= ? AND {column} < ?", [key, key + "\uffff"]
+
+        after = ("", "")
+        while True:
+            # Keyset paging: each chunk starts after the last row of the previous one
+            with self.commit_lock:
+                rows = self.conn.execute(
+                    f"SELECT {', '.join(ACCOUNT_FIELDS)}, {column} FROM accounts "
+                    f"WHERE {where} AND ({column}, cnic) > (?, ?) ORDER BY {column}, cnic LIMIT ?",
+                    params + list(after) + [self.SEARCH_CHUNK]
+                ).fetchall()
+                cnics = [row[1] for row in rows]
+                spending = self.load_spending(f"WHERE cnic IN ({', '.join('?' * len(cnics))})", cnics)
+
+            for row in rows:
+                cnic = row[1]
+                yield cnic, self.cache.get(cnic) or dict(zip(ACCOUNT_FIELDS, row), spending=spending.get(cnic, {}))
+            if len(rows) < self.SEARCH_CHUNK:
+                return
+            after = (rows[-1][-1], rows[-1][1])
+
+    def standing_orders(self):
+        # Straight from the table, without building a header per account
+        with self.commit_lock:
+            rows = self.conn.execute(
+                f"SELECT cnic, {', '.join(STANDING_ORDER_FIELDS)} FROM standing_orders ORDER BY next"
+            ).fetchall()
+        for row in rows:
+            yield row[0], dict(zip(STANDING_ORDER_FIELDS, row[1:]))
+
+    def write_header_rows(self, acc):
+        """Replace an account's spending and standing order rows with those of its header"""
+        self.conn.execute("DELETE FROM spending WHERE cnic = ?", (acc["cnic"],))
+        self.conn.executemany(INSERT_SPENDING, spending_rows(acc["cnic"], acc.get("spending", {})))
+        self.conn.execute("DELETE FROM standing_orders WHERE cnic = ?", (acc["cnic"],))
+        self.conn.executemany(INSERT_STANDING_ORDER, standing_order_rows(acc["cnic"], acc.get("standing_orders", [])))
+
+    def write_conflict(self, cnic):
+        """Why an account's header did not update: AccountGone if it was
+        deleted, else VersionConflict. Call inside the write's transaction."""
+        if self.conn.execute("SELECT 1 FROM accounts WHERE cnic = ?", (cnic,)).fetchone() is None:
+            return AccountGone(f"account {cnic} no longer exists")
+        return VersionConflict(f"account {cnic} was changed by another process")
+
+    @metrics.timed("commit")
+    def put_account(self, acc):
+        acc.setdefault("version", 0)
+        with self.commit_lock:
+            with self.conn:
+                values = [acc[field] for field in HEADER_FIELDS]
+                updated = self.conn.execute(UPDATE_ACCOUNT, values + [acc["cnic"], acc["version"]]).rowcount
+                if not updated:
+                    if acc["version"] != 0:
+                        raise self.write_conflict(acc["cnic"])
+                    try:
+                        self.conn.execute(INSERT_NEW_ACCOUNT, [acc[field] for field in ACCOUNT_FIELDS[:-1]] + [1])
+                    except sqlite3.IntegrityError:
+                        raise VersionConflict(f"account {acc['cnic']} was opened by another process")
+                self.write_header_rows(acc)
+            acc["version"] += 1
+            self.cache[acc["cnic"]] = acc
+            self.change_count += 1
+
+    def add_transaction(self, acc, transaction):
+        self.add_transactions([(acc, transaction)])
+
+    @metrics.timed("commit")
+    def add_transactions(self, entries, headers=()):
+        versions = {}
+        with self.commit_lock:
+            with self.conn:
+                for acc, transaction in entries:
+                    version = versions.get(acc["cnic"], acc["version"])
+                    self.conn.execute(INSERT_TRANSACTION, transaction_to_row(acc["cnic"], transaction))
+                    updated = self.conn.execute(
+                        "UPDATE accounts SET balance = ?, monthly_spending = ?, version = version + 1 "
+                        "WHERE cnic = ? AND version = ?",
+                        (acc["balance"], acc["monthly_spending"], acc["cnic"], version)
+                    ).rowcount
+                    if not updated:
+                        raise self.write_conflict(acc["cnic"])
+                    versions[acc["cnic"]] = version + 1
+                    if transaction.sign < 0:
+                        # The header already holds the new running total
+                        month = month_key(transaction.date)
+                        self.conn.execute(INSERT_SPENDING, (
+                            acc["cnic"], month, transaction.type, acc["spending"][month][transaction.type]
+                        ))
+                for acc in headers:
+                    version = versions.get(acc["cnic"], acc["version"])
+                    values = [acc[field] for field in HEADER_FIELDS]
+                    if not self.conn.execute(UPDATE_ACCOUNT, values + [acc["cnic"], version]).rowcount:
+                        raise self.write_conflict(acc["cnic"])
+                    versions[acc["cnic"]] = version + 1
+                    self.write_header_rows(acc)
+            for acc in [acc for acc, _ in entries] + list(headers):
+                acc["version"] = versions[acc["cnic"]]
+            self.note_payments([(acc["cnic"], transaction) for acc, transaction in entries])
+            self.change_count += 1
+
+    @metrics.timed("commit")
+    def delete_account(self, cnic):
+        with self.views_excluded(), self.commit_lock:
+            with self.conn:
+                self.conn.execute("DELETE FROM transactions WHERE cnic = ?", (cnic,))
+                self.conn.execute("DELETE FROM spending WHERE cnic = ?", (cnic,))
+                self.conn.execute("DELETE FROM standing_orders WHERE cnic = ?", (cnic,))
+                self.conn.execute("DELETE FROM accounts WHERE cnic = ?", (cnic,))
+            self.cache.pop(cnic, None)
+            self.archive.forget(cnic)
+            self.payment_cache.clear()
+            self.change_count += 1
+
+    @metrics.timed("archive")
+    def archive_history(self, before):
+        """Each account keeps the months of its last RECENT_TRANSACTIONS
+        transactions in the table, where the header's "recent" list is read
+        from. The archive is committed first, then the rows are deleted."""
+        with self.views_excluded(), self.commit_lock:
+            # The first month each account keeps: `before`, or earlier for its recent transactions
+            keep = {}
+            seen = {}
+            for cnic, date in self.conn.execute("SELECT cnic, date FROM transactions ORDER BY cnic, id DESC"):
+                seen[cnic] = seen.get(cnic, 0) + 1
+                if seen[cnic] <= RECENT_TRANSACTIONS:
+                    keep[cnic] = min(keep.get(cnic, before), month_key(date))
+
+            archived = self.archive.months_by_account()
+            moved = {}    # month -> {cnic: transactions}
+            ids = []
+            for row in self.conn.execute(f"SELECT id, cnic, {', '.join(TRANSACTION_FIELDS)} FROM transactions ORDER BY id"):
+                month = month_key(row[3])
+                if month < keep.get(row[1], before):
+                    if month not in archived.get(row[1], ()):   # else left behind by an interrupted run
+                        moved.setdefault(month, {}).setdefault(row[1], []).append(row_to_transaction(row[2:]))
+                    ids.append((row[0],))
+
+            for month, histories in sorted(moved.items()):
+                self.archive.add(month, histories)
+            with self.conn:
+                self.conn.executemany("DELETE FROM transactions WHERE id = ?", ids)
+            self.payment_cache.clear()
+            self.change_count += 1
+        return sum(len(transactions) for histories in moved.values() for transactions in histories.values())
+
+    @metrics.timed("save")
+    def save_all(self):
+        with self.commit_lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def view(self):
+        views_lock = self.hold_views_lock()
+        try:
+            return SqliteView(self, views_lock)
+        except Exception:
+            release_views_lock(views_lock)
+            raise
+
+    def close(self):
+        with self.commit_lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class SqliteView(SqliteBackend):
+    """A SqliteBackend frozen at the moment SqliteBackend.view() was called.
+
+    Its own connection keeps one read transaction open, which (in WAL mode)
+    goes on seeing the database as of its first read while other
+    connections commit. The views lock keeps the archive from changing."""
+
+    def __init__(self, store, views_lock):
+        super().__init__(store.db_file)
+        self.views_lock = views_lock
+        self.taken = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False)
+        self.conn.execute("BEGIN")
+        self.conn.execute("SELECT COUNT(*) FROM accounts").fetchone()   # the read transaction starts here
+
+    def refresh(self):
+        pass   # stays at its moment
+
+    def items(self):
+        with self.commit_lock:
+            orders = self.load_standing_orders()
+        for cnic, acc in super().items():
+            yield cnic, dict(acc, standing_orders=orders.get(cnic, []))
+
+    def close(self):
+        super().close()   # ending the read transaction
+        if self.views_lock is not None:
+            release_views_lock(self.views_lock)
+            self.views_lock = None
+
+
+# ---------------- BACKUPS ----------------
+#
+# A backup is a point-in-time copy of the whole store written from a
+# view(), so sessions keep committing while it is written: a JSON lines
+# file with a header line, {"format": "cashit-backup", "taken": ..., "units":
+# "paisa"}, then one line per account, {"account": header, "history":
+# [transaction, ...]}, with its full history including archived months.
+# The file is written under a temporary name and renamed into place, and
+# then its SHA-256 is written next to it, as backup.jsonl.sha256 in the
+# format sha256sum -c reads.
+
+BACKUP_FORMAT = "cashit-backup"
+BACKUP_FIELDS = ACCOUNT_FIELDS + ("spending", "standing_orders")
+
+
+@metrics.timed("backup")
+def write_backup(view, path):
+    """Write a view to `path`, and its checksum to `path`.sha256.
+    Returns (accounts written, SHA-256 hex digest)."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    digest = hashlib.sha256()
+    accounts = 0
+    temp_file = path + ".tmp"
+    with open(temp_file, "wb") as f:
+        def write(record):
+            line = json.dumps(record).encode() + b"\n"
+            digest.update(line)
+            f.write(line)
+
+        write({"format": BACKUP_FORMAT, "taken": view.taken, "units": "paisa"})
+        for cnic, acc in view.items():
+            write({"account": {field: acc[field] for field in BACKUP_FIELDS if field in acc}, "history": view.history(cnic)})
+            accounts += 1
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+    checksum = digest.hexdigest()
+    write_atomic(path + ".sha256", f"{checksum}  {os.path.basename(path)}\n")
+    return accounts, checksum
+
+
+def verify_backup(path):
+    """True if a backup still matches the checksum written next to it"""
+    with open(path + ".sha256", "r") as f:
+        expected = f.read().split()[0]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest() == expected
+
+
+class BackupThread(threading.Thread):
+    """Writes a view to a backup in the background, then closes the view.
+    Afterwards `result` holds what write_backup() returned, or `error` what
+    it raised."""
+
+    def __init__(self, view, path):
+        super().__init__(name="backup", daemon=True)
+        self.view = view
+        self.path = path
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = write_backup(self.view, self.path)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.view.close()
+
+
+def start_backup(store, path):
+    """Back the store up to `path` as it is at this call, in a background
+    thread. Returns the started BackupThread."""
+    thread = BackupThread(store.view(), path)
+    thread.start()
+    return thread
+
+
+# ---------------- BACKEND SELECTION ----------------
+
+def open_backend(kind=None):
+    """Create the backend named by `kind` or the CASHIT_STORAGE environment variable"""
+    kind = kind or os.environ.get("CASHIT_STORAGE", "json")
+
+    if kind == "json":
+        return JsonBackend()
+    if kind == "sqlite":
+        return SqliteBackend(os.environ.get("CASHIT_DB", "cashit.db"))
+
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def migrate_json_to_sqlite(data_file="users.json", db_file="cashit.db"):
+    """One-shot copy of users.json or users.snap (and any pending journal) into a new SQLite database.
+
+    Loading a store upgrades legacy files in place and creates its lock
+    file, so the store is read from a temporary copy and left untouched."""
+    original = JsonBackend(data_file, os.path.splitext(data_file)[0] + ".journal")
+    if original.snapshot_file() is None:
+        raise FileNotFoundError(data_file)
+    if os.path.exists(db_file):
+        raise FileExistsError(db_file)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # copy2 keeps modification times, which decide between users.json and users.snap
+        for path in (original.data_file, original.snap_file, original.journal_file):
+            if os.path.exists(path):
+                shutil.copy2(path, directory)
+        if os.path.isdir(original.history_dir):
+            shutil.copytree(original.history_dir, os.path.join(directory, "history"))
+        source = JsonBackend(
+            os.path.join(directory, os.path.basename(data_file)),
+            os.path.join(directory, os.path.basename(original.journal_file))
+        )
+        if source.snapshot_file() == source.snap_file:
+            source.snapshot_format = "binary"   # read as it is, not converted
+        if source.load({}) == "corrupted":
+            raise ValueError(f"{data_file} is corrupted or invalid")
+
+        target = SqliteBackend(db_file)
+        target.load({})
+        target.import_accounts((acc, source.history(cnic)) for cnic, acc in source.items())
+        count = len(target)
+        target.close()
+        source.close()
+    return count
+
+
+def convert_snapshot(snapshot_format, data_file="users.json"):
+    """Rewrite the JSON store's snapshot as users.json or users.snap, folding in the journal"""
+    store = JsonBackend(data_file, os.path.splitext(data_file)[0] + ".journal", snapshot_format)
+    if store.snapshot_file() is None:
+        raise FileNotFoundError(data_file)
+    if store.load({}) == "corrupted":
+        raise ValueError(f"{store.snapshot_file()} is corrupted or invalid")
+    store.save_all()
+    store.close()
+    return len(store)
+
+
+USAGE = """Usage: python storage.py migrate [users.json] [cashit.db]
+       python storage.py convert json|binary [users.json]"""
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        try:
+            migrated = migrate_json_to_sqlite(*sys.argv[2:4])
+        except Exception as e:
+            print(f"❌ Migration failed: {e}")
+            sys.exit(1)
+        print(f"✓ Migrated {migrated} account(s) to SQLite.")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "convert" and sys.argv[2] in SNAPSHOT_FORMATS:
+        try:
+            converted = convert_snapshot(*sys.argv[2:4])
+        except Exception as e:
+            print(f"❌ Conversion failed: {e}")
+            sys.exit(1)
+        print(f"✓ Wrote a {sys.argv[2]} snapshot of {converted} account(s).")
+    else:
+        print(USAGE)
+        sys.exit(1)
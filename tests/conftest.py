@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cashit
+import storage
+
+BACKENDS = ("json", "binary", "sqlite")
+
+def open_backend(kind, directory):
+    """A store of `kind` ("json", "binary" or "sqlite") kept in `directory`, not yet loaded"""
+    if kind in ("json", "binary"):
+        return storage.JsonBackend(
+            os.path.join(directory, "users.json"), os.path.join(directory, "users.journal"), kind
+        )
+    return storage.SqliteBackend(os.path.join(directory, "cashit.db"))
+
+def open_again(store, directory):
+    """Another store on the same files as `store`, as a second process would open"""
+    kind = store.snapshot_format if isinstance(store, storage.JsonBackend) else "sqlite"
+    again = open_backend(kind, directory)
+    assert again.load({}) == "loaded"
+    return again
+
+def reopen(store, directory):
+    """Close `store` and load what it left on disk, as the next run would"""
+    store.close()
+    return open_again(store, directory)
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    """A store of each backend seeded with the default accounts"""
+    store = open_backend(request.param, str(tmp_path))
+    store.load(cashit.get_default_users())
+    yield store
+    store.close()
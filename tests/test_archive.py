@@ -0,0 +1,67 @@
+import pytest
+
+import cashit
+import storage
+from conftest import reopen
+
+CNIC = "35202-4444444-4"
+
+def txn(description, date, amount=100 * 100, kind="bill", reference=None):
+    return storage.make_transaction(description, date, "10:00 AM", amount, -1, kind, 0, reference)
+
+def commit(store, acc, transactions):
+    """Persist transactions already in the past, as post_transactions() would"""
+    for t in transactions:
+        storage.push_recent(acc, t)
+        storage.add_spending(acc, t)
+    store.add_transactions([(acc, t) for t in transactions])
+
+def ordered(transactions):
+    return sorted(transactions, key=lambda t: (t.date, t.time, t.description))
+
+def test_archive_moves_every_old_month(store, tmp_path):
+    acc = {
+        "name": "Zainab Malik", "cnic": CNIC, "iban": "PK88 8888 8888 8888 8888 88", "pin": "2468",
+        "balance": 0, "savings": 0, "monthly_spending": 0, "spending": {},
+    }
+    # Newest first, as legacy and seeded histories are
+    store.import_accounts([(acc, [txn("March", "Mar 03, 2026"), txn("May", "May 05, 2025"), txn("April", "Apr 04, 2025")])])
+    acc = store[CNIC]
+    # A backdated transaction still in the journal, then enough recent ones to fill the header
+    commit(store, acc, [txn("June", "Jun 06, 2025")])
+    commit(store, acc, [txn(f"Recent {n}", f"Apr {10 + n}, 2026") for n in range(storage.RECENT_TRANSACTIONS + 1)])
+    before = ordered(store.history(CNIC))
+
+    store.archive_history("2026-01")
+
+    archived, months = store.archive.history(CNIC)
+    assert months == {"2025-04", "2025-05", "2025-06"}
+    assert sorted(t.description for t in archived) == ["April", "June", "May"]
+    assert ordered(store.history(CNIC)) == before
+    assert ordered(reopen(store, str(tmp_path)).history(CNIC)) == before
+
+def test_archive_again_moves_nothing(store):
+    store.archive_history("2026-01")
+    histories = {cnic: ordered(store.history(cnic)) for cnic, _ in store.items()}
+
+    assert store.archive_history("2026-01") == 0
+    assert {cnic: ordered(store.history(cnic)) for cnic, _ in store.items()} == histories
+
+def test_archived_challan_cannot_be_paid_again(store, tmp_path):
+    acc = {
+        "name": "Zainab Malik", "cnic": CNIC, "iban": "PK88 8888 8888 8888 8888 88", "pin": "2468",
+        "balance": 5000 * 100, "savings": 0, "monthly_spending": 0, "spending": {},
+    }
+    challan = txn("E-Challan CH-9", "May 05, 2025", kind="challan", reference="CH-9")
+    store.import_accounts([(acc, [challan])])
+    acc = store[CNIC]
+    commit(store, acc, [txn(f"Recent {n}", f"Apr {10 + n}, 2026") for n in range(storage.RECENT_TRANSACTIONS + 1)])
+    assert store.last_payment("challan", "CH-9") == (CNIC, challan)
+
+    store.archive_history("2026-01")
+
+    assert store.archive.history(CNIC)[1] == {"2025-05"}
+    assert store.find_payments("challan", "CH-9") == [(CNIC, challan)]
+    with pytest.raises(cashit.DuplicatePayment):
+        cashit.pay(store, store[CNIC], 2000 * 100, "E-Challan CH-9", "challan", "CH-9")
+    assert reopen(store, str(tmp_path)).last_payment("challan", "CH-9") == (CNIC, challan)
@@ -0,0 +1,54 @@
+import json
+
+import cashit
+import storage
+
+ALI = "35202-9823471-2"
+
+def read_backup(path):
+    with open(path, "r") as f:
+        header, *records = [json.loads(line) for line in f]
+    return header, {r["account"]["cnic"]: r for r in records}
+
+def test_fresh_store_backs_up_and_verifies(store, tmp_path):
+    path = str(tmp_path / "backups" / "cashit.jsonl")
+    defaults = cashit.get_default_users()
+    balance = store[ALI]["balance"]
+
+    thread = storage.start_backup(store, path)
+    thread.join()
+
+    assert thread.error is None
+    accounts, checksum = thread.result
+    assert accounts == len(defaults)
+    assert storage.verify_backup(path)
+    header, records = read_backup(path)
+    assert header["units"] == "paisa"
+    assert set(records) == set(defaults)
+    assert records[ALI]["account"]["balance"] == balance
+    assert len(records[ALI]["history"]) == len(defaults[ALI]["transactions"])
+
+def test_backup_holds_the_store_as_of_the_view(store, tmp_path):
+    path = str(tmp_path / "cashit.jsonl")
+    balance = store[ALI]["balance"]
+    view = store.view()
+    cashit.pay(store, store[ALI], 1000 * 100, "LESCO Bill", "bill", "LESCO-1")
+
+    storage.write_backup(view, path)
+    view.close()
+
+    _, records = read_backup(path)
+    assert records[ALI]["account"]["balance"] == balance
+    assert all(t[-1] != "LESCO-1" for t in records[ALI]["history"])
+    assert store[ALI]["balance"] == balance - 1000 * 100
+
+def test_tampered_backup_fails_verification(store, tmp_path):
+    path = str(tmp_path / "cashit.jsonl")
+    view = store.view()
+    storage.write_backup(view, path)
+    view.close()
+
+    with open(path, "r+b") as f:
+        f.seek(-3, 2)
+        f.write(b"9")
+    assert not storage.verify_backup(path)
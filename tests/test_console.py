@@ -0,0 +1,46 @@
+import json
+
+import cashit
+import python
+
+ALI = "35202-9823471-2"
+
+class RecordingTerminal(python.ScriptedTerminal):
+    def __init__(self, answers):
+        super().__init__(answers)
+        self.screen = ""
+
+    def write(self, text):
+        self.screen += text
+
+def test_login_shows_success_before_the_pause(store, monkeypatch):
+    terminal = RecordingTerminal([ALI, "1234"])
+    shown = []
+    monkeypatch.setattr(python, "USERS", store)
+    monkeypatch.setattr(python.time, "sleep", lambda seconds: shown.append(terminal.screen))
+    python.bind_terminal(terminal, "text")
+    try:
+        with python.screen():
+            acc = python.login()
+    finally:
+        python.bind_terminal(python.CONSOLE)
+
+    assert acc["cnic"] == ALI
+    assert len(shown) == 1 and "Login Successful" in shown[0]
+
+def test_duplicate_challan_is_a_json_receipt(store, monkeypatch):
+    cashit.pay(store, store[ALI], 2000 * 100, "E-Challan CH-501", "challan", "CH-501")
+    terminal = RecordingTerminal(["CH-501"])
+    monkeypatch.setattr(python, "USERS", store)
+    python.bind_terminal(terminal, "json")
+    try:
+        with python.screen():
+            python.challan_payment(store[ALI])
+    finally:
+        python.bind_terminal(python.CONSOLE)
+
+    receipt = json.loads(terminal.screen.strip().splitlines()[-1])
+    assert receipt["screen"] == "receipt"
+    assert receipt["status"] == "duplicate"
+    assert receipt["amount"] is None
+    assert "CH-501" in receipt["error"]
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+
+import cashit
+import storage
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "python.py")
+ALI = "35202-9823471-2"
+
+def run_app(directory, *answers):
+    """Run the console app in `directory` on scripted answers. Input runs out
+    with an EOFError, so the run ends as a killed process would: unsaved."""
+    done = subprocess.run(
+        [sys.executable, APP], cwd=directory, input="\n".join(answers) + "\n",
+        capture_output=True, encoding="utf-8", timeout=60, env=dict(os.environ, PYTHONIOENCODING="utf-8")
+    )
+    return done.stdout
+
+def pay_bill(directory, reference, amount):
+    return run_app(directory, "1", ALI, "1234", "2", reference, amount, "y")
+
+def login(directory):
+    return run_app(directory, "1", ALI, "1234")
+
+def test_commits_since_the_snapshot_are_replayed(tmp_path):
+    pay_bill(tmp_path, "LESCO-1", "1500")
+    pay_bill(tmp_path, "PTCL-1", "500")
+
+    screen = login(tmp_path)
+
+    assert "Replayed 2 journal record(s)" in screen
+    assert "Rs 1,243,500.00" in screen
+    assert "Bill Payment - ID PTCL-1" in screen
+
+def test_torn_last_record_is_dropped(tmp_path):
+    pay_bill(tmp_path, "LESCO-1", "1500")
+    journal = tmp_path / "users.journal"
+    intact = journal.stat().st_size
+    with open(journal, "ab") as f:
+        f.write(b'{"op": "txn", "cnic": "35202-98')
+
+    screen = login(tmp_path)
+
+    assert "Replayed 1 journal record(s)" in screen
+    assert "Rs 1,244,000.00" in screen
+    assert journal.stat().st_size == intact
+
+def test_journal_left_by_a_crash_during_save_is_not_applied_twice(tmp_path):
+    pay_bill(tmp_path, "LESCO-1", "1500")
+    journal = tmp_path / "users.journal"
+    stale = journal.read_bytes()
+    store = storage.JsonBackend(str(tmp_path / "users.json"), str(journal))
+    store.load(cashit.get_default_users())
+    store.save_all()
+    # The new snapshot was renamed into place, but the old journal never reset
+    journal.write_bytes(stale)
+
+    screen = login(tmp_path)
+
+    assert "Replayed" not in screen
+    assert "Rs 1,244,000.00" in screen
@@ -0,0 +1,30 @@
+import json
+import os
+
+import storage
+
+CNIC = "35202-1234567-8"
+
+def test_migration_leaves_a_legacy_store_untouched(tmp_path):
+    data_file = str(tmp_path / "users.json")
+    # Pre-history layout: rupees as floats, transactions inline
+    with open(data_file, "w") as f:
+        json.dump({CNIC: {
+            "name": "Ali Khan", "cnic": CNIC, "iban": "PK36 SCBL 0000 0011 2345 6702", "pin": "1234",
+            "balance": 1500.5, "savings": 0.0, "monthly_spending": 0.0,
+            "transactions": [["Opening Bonus", "Jan 01, 2024", "+2000"], ["LESCO Bill", "Jan 05, 2024", "-499.50"]],
+        }}, f)
+    with open(data_file, "rb") as f:
+        original = f.read()
+
+    assert storage.migrate_json_to_sqlite(data_file, str(tmp_path / "cashit.db")) == 1
+
+    assert {name for name in os.listdir(tmp_path) if name.startswith("users")} == {"users.json"}
+    assert not os.path.exists(tmp_path / "history")
+    with open(data_file, "rb") as f:
+        assert f.read() == original
+    migrated = storage.SqliteBackend(str(tmp_path / "cashit.db"))
+    migrated.load({})
+    assert migrated[CNIC]["balance"] == 150050
+    assert [t.description for t in migrated.history(CNIC)] == ["Opening Bonus", "LESCO Bill"]
+    migrated.close()
@@ -0,0 +1,47 @@
+import pytest
+
+import cashit
+import storage
+from conftest import open_again
+
+ROWS = [
+    ("35202-1111111-1", "Hina Aslam", "PK44 4444 4444 4444 4444 44", "4821"),
+    ("35202-2222222-2", "Bilal Qureshi", "PK55 5555 5555 5555 5555 55", "7390"),
+]
+
+def test_import_refuses_an_account_opened_by_another_process(store, tmp_path):
+    other = open_again(store, str(tmp_path))
+    cashit.open_account(other, "35202-1111111-1", "Hina Aslam", "PK44 4444 4444 4444 4444 44", "4821")
+    other.close()
+
+    taken_cnic = cashit.new_account("35202-1111111-1", "Someone Else", "PK66 6666 6666 6666 6666 66", "1357")
+    fresh = cashit.new_account(*ROWS[1])
+    with pytest.raises(storage.VersionConflict):
+        store.import_accounts([(fresh, []), (taken_cnic, [])])
+
+    taken_iban = cashit.new_account("35202-3333333-3", "Someone Else", "PK44 4444 4444 4444 4444 44", "1357")
+    with pytest.raises(storage.VersionConflict):
+        store.import_accounts([(taken_iban, [])])
+
+    store.refresh()
+    assert store["35202-1111111-1"]["name"] == "Hina Aslam"
+    assert store.find_iban("PK44 4444 4444 4444 4444 44") == "35202-1111111-1"
+    assert "35202-2222222-2" not in store
+    assert "35202-3333333-3" not in store
+
+def test_onboarding_rechecks_after_losing_a_race(store, tmp_path, monkeypatch):
+    existing = store.existing
+
+    def stale_existing(cnics):
+        # As if another process opened the first row's account right after this check
+        monkeypatch.setattr(store, "existing", existing)
+        other = open_again(store, str(tmp_path))
+        cashit.open_account(other, "35202-1111111-1", "Hina Aslam", "PK77 7777 7777 7777 7777 77", "4821")
+        other.close()
+        return set()
+
+    monkeypatch.setattr(store, "existing", stale_existing)
+    assert cashit.onboard_accounts(store, ROWS) == ["duplicate_cnic", "ok"]
+    assert store["35202-1111111-1"]["iban"] == storage.iban_key("PK77 7777 7777 7777 7777 77")
+    assert store["35202-2222222-2"]["balance"] == cashit.OPENING_BONUS
+    assert store.find_iban("PK55 5555 5555 5555 5555 55") == "35202-2222222-2"
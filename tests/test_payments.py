@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+import cashit
+import storage
+from conftest import open_again
+
+ALI = "35202-9823471-2"
+SARA = "35202-9876543-1"
+
+def test_challan_cannot_be_paid_twice(store):
+    acc = store[ALI]
+    first = cashit.pay(store, acc, 2000 * 100, "E-Challan CH-501", "challan", "CH-501")
+    balance = acc["balance"]
+
+    with pytest.raises(cashit.DuplicatePayment) as raised:
+        cashit.pay(store, store[SARA], 2000 * 100, "E-Challan CH-501", "challan", "CH-501")
+
+    assert raised.value.payment == (ALI, first)
+    assert acc["balance"] == balance
+    assert [t for _, t in store.find_payments("challan", "CH-501")] == [first]
+
+def test_concurrent_challan_payments_only_one_succeeds(store):
+    outcomes = []
+    start = threading.Barrier(2)
+
+    def pay(cnic):
+        start.wait()
+        try:
+            outcomes.append(cashit.pay(store, store[cnic], 2000 * 100, "E-Challan CH-777", "challan", "CH-777"))
+        except cashit.DuplicatePayment:
+            outcomes.append("duplicate")
+
+    threads = [threading.Thread(target=pay, args=(cnic,)) for cnic in (ALI, SARA)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(outcomes, key=str).count("duplicate") == 1
+    assert len(store.find_payments("challan", "CH-777")) == 1
+
+def test_bills_may_be_paid_again(store):
+    cashit.pay(store, store[ALI], 1000 * 100, "LESCO Bill", "bill", "LESCO-9")
+    assert cashit.pay(store, store[ALI], 1000 * 100, "LESCO Bill", "bill", "LESCO-9") is not None
+
+def test_payment_from_a_deleted_account_is_refused(store):
+    acc = store[ALI]
+    balance = acc["balance"]
+    cashit.delete_account(store, ALI)
+
+    with pytest.raises(storage.AccountGone):
+        cashit.pay(store, acc, 500 * 100, "LESCO Bill", "bill", "LESCO-1")
+
+    assert acc["balance"] == balance
+    assert ALI not in store
+
+def test_payment_from_an_account_deleted_elsewhere_is_not_retried(store, tmp_path, monkeypatch):
+    acc = store[ALI]
+    balance = acc["balance"]
+    other = open_again(store, str(tmp_path))
+    cashit.delete_account(other, ALI)
+    other.close()
+    attempts = []
+    monkeypatch.setattr(store, "refresh", lambda: attempts.append(1))
+
+    with pytest.raises(storage.AccountGone):
+        cashit.pay(store, acc, 500 * 100, "LESCO Bill", "bill", "LESCO-1")
+
+    assert len(attempts) == 1
+    assert acc["balance"] == balance
+    assert ALI not in open_again(store, str(tmp_path))
+
+@pytest.mark.parametrize("amount", [0, -500 * 100])
+def test_amounts_must_be_positive(store, amount):
+    acc = store[ALI]
+    balance = acc["balance"]
+    history = list(store.history(ALI))
+
+    with pytest.raises(ValueError):
+        cashit.pay(store, acc, amount, "LESCO Bill", "bill", "LESCO-1")
+    with pytest.raises(ValueError):
+        cashit.transfer(store, acc, amount, store[SARA]["iban"], "Transfer to Sara")
+    with pytest.raises(ValueError):
+        cashit.transfer(store, acc, amount, "PK00 HBL 0000 0000 0000 0001", "Transfer out")
+    with pytest.raises(ValueError):
+        cashit.admin_adjust_balance(store, acc, amount, credit=False)
+
+    assert acc["balance"] == balance
+    assert list(store.history(ALI)) == history
@@ -0,0 +1,102 @@
+import pytest
+
+import cashit
+
+ALI = "35202-9823471-2"
+SARA = "35202-9876543-1"
+AHMED = "35202-1234567-9"
+
+def test_due_payment_order_runs_end_to_end(store):
+    acc = store[ALI]
+    balance = acc["balance"]
+    order = cashit.add_standing_order(store, acc, "tax", "NTN-7781", 2500 * 100, "monthly", first="2026-01-05")
+
+    scheduler = cashit.StandingOrderScheduler(store)
+    assert scheduler.run("2026-01-04") == []
+    [(run, (status, transaction))] = scheduler.run("2026-01-05")
+
+    assert run == (ALI, order["id"], "2026-01-05")
+    assert status == "ok"
+    assert transaction.type == "tax"
+    assert transaction.reference == "NTN-7781"
+    assert store[ALI]["balance"] == balance - 2500 * 100
+    assert cashit.find_standing_order(store[ALI], order["id"])["next"] == "2026-02-05"
+    assert store.history(ALI)[-1] == transaction
+    assert store.last_payment("tax", "NTN-7781") == (ALI, transaction)
+
+def test_challan_cannot_be_a_standing_order(store):
+    with pytest.raises(ValueError):
+        cashit.add_standing_order(store, store[ALI], "challan", "CH-1", 2500 * 100, "monthly", first="2026-01-05")
+    assert store[ALI].get("standing_orders", []) == []
+
+def test_challan_order_set_up_earlier_pays_only_once(store):
+    acc = store[ALI]
+    balance = acc["balance"]
+    with store.locked(ALI):
+        acc["standing_orders"] = [{
+            "id": 1, "kind": "challan", "reference": "CH-1", "amount": 2500 * 100,
+            "every": "monthly", "day": 5, "next": "2026-01-05",
+        }]
+        store.put_account(acc)
+
+    results = cashit.StandingOrderScheduler(store).run("2026-04-05")
+
+    assert [status for _, (status, _) in results] == ["ok", "duplicate", "duplicate", "duplicate"]
+    assert store[ALI]["balance"] == balance - 2500 * 100
+    assert len(store.find_payments("challan", "CH-1")) == 1
+    with pytest.raises(cashit.DuplicatePayment):
+        cashit.pay(store, store[ALI], 2500 * 100, "E-Challan CH-1", "challan", "CH-1")
+
+def test_missed_runs_all_happen_in_date_order(store):
+    acc = store[ALI]
+    balance = acc["balance"]
+    order = cashit.add_standing_order(store, acc, "bill", "LESCO-42", 100 * 100, "daily", first="2026-01-01")
+
+    scheduler = cashit.StandingOrderScheduler(store)
+    results = scheduler.run("2026-01-03")
+
+    assert [run for run, _ in results] == [(ALI, order["id"], f"2026-01-0{day}") for day in (1, 2, 3)]
+    assert [status for _, (status, _) in results] == ["ok", "ok", "ok"]
+    assert store[ALI]["balance"] == balance - 3 * 100 * 100
+    assert cashit.find_standing_order(store[ALI], order["id"])["next"] == "2026-01-04"
+    assert scheduler.run("2026-01-03") == []
+
+def test_uncovered_run_is_missed_and_the_order_moves_on(store):
+    acc = store[AHMED]
+    balance = acc["balance"]
+    order = cashit.add_standing_order(store, acc, "tax", "NTN-1", balance + 1, "weekly", first="2026-01-01")
+
+    [(_, (status, transaction))] = cashit.StandingOrderScheduler(store).run("2026-01-01")
+
+    assert (status, transaction) == ("insufficient_balance", None)
+    assert store[AHMED]["balance"] == balance
+    assert cashit.find_standing_order(store[AHMED], order["id"])["next"] == "2026-01-08"
+
+def test_transfer_order_credits_the_receiver(store):
+    sender, receiver = store[ALI], store[SARA]
+    sent, received = sender["balance"], receiver["balance"]
+    cashit.add_standing_order(store, sender, "transfer", receiver["iban"], 5000 * 100, "monthly", first="2026-01-31")
+
+    [(_, (status, _))] = cashit.StandingOrderScheduler(store).run("2026-01-31")
+
+    assert status == "ok"
+    assert store[ALI]["balance"] == sent - 5000 * 100
+    assert store[SARA]["balance"] == received + 5000 * 100
+    assert store.history(SARA)[-1].description == f"Transfer from {sender['name']}"
+
+def test_cancelled_order_does_not_run(store):
+    acc = store[ALI]
+    balance = acc["balance"]
+    order = cashit.add_standing_order(store, acc, "bill", "PTCL-9", 100 * 100, "daily", first="2026-01-01")
+    scheduler = cashit.StandingOrderScheduler(store)
+    scheduler.reload("2026-01-01")
+
+    assert cashit.cancel_standing_order(store, acc, order["id"])
+    assert scheduler.run("2026-01-01") == []
+    assert store[ALI]["balance"] == balance
+
+def test_monthly_order_keeps_its_day_through_short_months():
+    order = {"every": "monthly", "day": 31}
+    assert cashit.next_run(order, "2026-01-31") == "2026-02-28"
+    assert cashit.next_run(order, "2026-02-28") == "2026-03-31"
+    assert cashit.next_run(order, "2026-12-31") == "2027-01-31"